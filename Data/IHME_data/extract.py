@@ -1,42 +1,122 @@
+import argparse
+
 import pandas as pd
 
 # Make the code able run from any folder.
 from pathlib import Path
+import sys
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.append(str(BASE_DIR / 'Experiment/Shared'))
+
+from datasets import read_csv_cached  # noqa: E402
+from gbd import aggregate_gbd  # noqa: E402
+
+IHME_FILE = BASE_DIR / "Data/IHME_original_file.csv"
+# The countries of the stored mental_health_change_rate.csv (168 locations).
+# ratios_countries_social_media.csv misses 13 of them, like Australia.
+COUNTRIES_FILE = BASE_DIR / "Data/social_media_users_2021.csv"
+OUTPUT_FILE = BASE_DIR / "Data/mental_health_change_rate.csv"
+
+YEAR_PAIRS = [(2020, 2021)]
+
+
+def yearly_totals(path=IHME_FILE, years=None, locations=None):
+    ''' Returns the total value of every location (rows) and year (columns),
+        computed in one streaming pass over the file (see Shared/gbd.py).
+        Only the given years and locations are kept while reading. '''
+    filters = {}
+    if years is not None:
+        filters["year"] = years
+    if locations is not None:
+        filters["location"] = locations
+
+    totals = aggregate_gbd(path, ["location", "year"], "val", filters)
+    return totals["sum"].unstack("year")
+
+
+def change_rates(totals, year_pairs=YEAR_PAIRS, long=False):
+    ''' Returns the totals and change rates of all locations for the year
+        pairs (first year, second year).
+
+        Wide (default): a row per location with the total of every year and
+        a change rate per pair. With a single pair the columns are location,
+        <first year>, <second year> and change_rate, otherwise the rates are
+        named change_rate_<first year>_<second year>.
+        Long: a row per location and pair, with the columns location,
+        year_from, year_to, total_from, total_to and change_rate.
+    '''
+    # Locations without a value in a year get NaN change rates.
+    years = sorted({year for pair in year_pairs for year in pair})
+    totals = totals.reindex(columns=years)
+
+    if long:
+        frames = [pd.DataFrame({"location": totals.index,
+                                "year_from": first, "year_to": second,
+                                "total_from": totals[first].values,
+                                "total_to": totals[second].values})
+                  for first, second in year_pairs]
+        results = pd.concat(frames, ignore_index=True)
+        results["change_rate"] = ((results["total_to"] - results["total_from"])
+                                  / results["total_from"])
+        return results
+
+    results = totals.copy()
+    results.columns = [str(year) for year in years]
+    for first, second in year_pairs:
+        name = ("change_rate" if len(year_pairs) == 1
+                else f"change_rate_{first}_{second}")
+        results[name] = (totals[second] - totals[first]) / totals[first]
+
+    results.index.name = "location"
+    return results.reset_index()
 
 
 # get the raw data
-def extract():
-    # Only retain countries that are both listed in the two csv files.
-    data = pd.read_csv(BASE_DIR / "Data/IHME_original_file.csv")
-    data2 = pd.read_csv(BASE_DIR / "Data/ratios_countries_social_media.csv")
-
-    # get all names of countries in data2
-    countries = data2.index
-    results = []
-    for country in countries:
-        row_country = data[data["location"] == country]
-
-        # if the country does not exist in data1
-        if row_country.empty:
-            continue
-
-        # add all values in 2020
-        data_2020 = row_country[row_country["year"] == 2020]
-        total_2020 = data_2020["val"].sum()
-        data_2021 = row_country[row_country["year"] == 2021]
-        total_2021 = data_2021["val"].sum()
-
-        # calculate the change rate beterrn 2020 and 2021
-        change_rate = (total_2021 - total_2020) / total_2020
-        results.append({"location": country,
-                        "total_2020": total_2020,
-                        "total_2021": total_2021,
-                        "change_rate": change_rate})
-    results = pd.DataFrame(results)
-    results.to_csv(BASE_DIR / "Data/mental_health_change_rate.csv",
-                   index=False)
+def extract(year_pairs=YEAR_PAIRS, countries_file=COUNTRIES_FILE, long=False,
+            output_file=OUTPUT_FILE, input_file=IHME_FILE):
+    ''' Computes the totals and change rates of the IHME values in
+        input_file for the year pairs and stores them in output_file.
+
+        Args:
+            year_pairs: list of (first year, second year).
+            countries_file: only retain the locations that are in the
+                Country column of this csv file (None keeps all locations).
+            long: store a long table instead of a wide one (see
+                change_rates).
+            output_file: the csv file to store the results in.
+            input_file: the IHME export, with the columns location, year
+                and val.
+    '''
+    # Only retain the locations that are listed in countries_file.
+    countries = None
+    if countries_file is not None:
+        countries = read_csv_cached(countries_file, usecols=["Country"])
+        countries = countries["Country"].dropna().unique()
+
+    years = sorted({year for pair in year_pairs for year in pair})
+    totals = yearly_totals(input_file, years, countries)
+    results = change_rates(totals, year_pairs, long)
+    # CRLF line endings, like the other csv files in Data/.
+    results.to_csv(output_file, index=False, lineterminator="\r\n")
+    return results
 
 
 if __name__ == "__main__":
-    extract()
+    parser = argparse.ArgumentParser(
+        description="Computes the change rates of the IHME values.")
+    parser.add_argument("--pairs", nargs="+", default=["2020-2021"],
+                        help="year pairs like 2019-2020 2020-2021")
+    parser.add_argument("--all-locations", action="store_true",
+                        help="keep the locations that are not in "
+                             "social_media_users_2021.csv")
+    parser.add_argument("--long", action="store_true",
+                        help="store a row per location and year pair")
+    parser.add_argument("--input", default=IHME_FILE,
+                        help="IHME export with location, year and val")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    pairs = [tuple(int(year) for year in pair.split("-"))
+             for pair in args.pairs]
+    extract(pairs, None if args.all_locations else COUNTRIES_FILE,
+            args.long, args.output, args.input)
@@ -0,0 +1,200 @@
+'''
+This file keeps the five extract functions of the first version of
+webscraping.py unchanged, as a reference for extractor.py:
+ - benchmark.py times them against extract_metrics;
+ - webscraping.tests() checks that extract_metrics finds the same values on
+   every page of the fixture store.
+They were written against the live datareportal pages, so they do not
+depend on the wording of the reconstructed pages (see fixtures.py).
+Do not change them.
+'''
+
+import re
+
+MULTIPLIERS = {
+    'thousand': 10 ** 3,
+    'million': 10 ** 6,
+    'billion': 10 ** 9
+}
+
+
+def extract_population(soup):
+    '''Extracts a country's population given a soup.
+    '''
+
+    if not soup:
+        print('Invalid soup')
+        return None
+
+    for bold in soup.find_all('b'):
+        bold_text = bold.get_text(" ").lower().strip()
+
+        # Skip bolds with no digits
+        if not any(c.isdigit() for c in bold_text):
+            continue
+
+        sentence = bold.parent.get_text(" ").lower()
+
+        number = 0.0
+        if 'population'not in sentence:
+            continue
+
+        splitted_text = bold_text.split()
+
+        number = float(splitted_text[0].replace(',', '.'))
+
+        if len(splitted_text) > 1 and splitted_text[1] in MULTIPLIERS:
+
+            number *= MULTIPLIERS[splitted_text[1]]
+        else:
+            number *= 1000  # value is smaller than 10000
+
+        return int(number)
+
+    return None
+
+
+def extract_number_social_media_users(soup):
+    '''
+    Extracts number of social media users given a soup.
+    '''
+
+    if not soup:
+        print('Invalid soup')
+        return None
+
+    for bold in soup.find_all("b"):
+        bold_text = bold.get_text(" ").lower().strip()
+
+        # Skip bolds with no digits
+        if not any(c.isdigit() for c in bold_text):
+            continue
+
+        sibling = bold.next_sibling
+
+        if not sibling or 'social media users' not in bold.next_sibling:
+            continue
+
+        splitted_text = bold_text.split()  # first value is integer
+        number = float(splitted_text[0].replace(',', '.'))
+
+        if len(splitted_text) > 1 and splitted_text[1] in MULTIPLIERS:
+            number *= MULTIPLIERS[splitted_text[1]]
+        else:
+            number *= 1000  # value is smaller than 10000
+
+        return int(number)
+
+    return None
+
+
+def get_ratio_population(soup):
+    ''' Returns the number of
+
+    Args:
+        soup: webpage file in which we need to find ratio.
+
+    Returns:
+        percentage in increase or decrease (including '-' for decrease)
+        and None on failure.
+    '''
+
+    if not soup:
+        print('Invalid soup')
+        return None
+
+    for bold in soup.find_all("b"):
+
+        sentence = bold.parent.get_text(" ").lower()
+
+        about_population = 'population' in sentence
+        in_time_period = 'between january 2020 and january 2021' in sentence
+
+        if not about_population or not in_time_period:
+            continue
+
+        if 'unchanged' in sentence:
+            return 0.0
+
+        match = re.search(r'\(([-+]?[\d\.]+)%\)', sentence)
+        # print(match)
+
+        if match:
+            percentage = float(match.group(1))
+            return percentage
+
+    return None
+
+
+def get_ratio_users(soup):
+    '''Returns the percentage of media users a country
+    increased/decreased in 2020-2021.
+    '''
+
+    if not soup:
+        print('Invalid soup')
+        return None
+
+    for bold in soup.find_all("b"):
+
+        sentence = bold.parent.get_text(" ").lower()
+
+        about_population = 'social media users' in sentence
+        in_time_period = 'between 2020 and 2021' in sentence # or 'in january 2021' in sentence  # Check this for christmas island
+
+        if not about_population or not in_time_period:
+            continue
+
+        if 'unchanged' in sentence:
+            return 0.0
+
+        match = re.search(r'\(([-+]?[\d\.]+)%\)', sentence)
+
+        if match:
+            percentage = float(match.group(1))
+            return percentage
+
+        match2 = re.search(r'([-+]?[\d\.]+)%', sentence)
+
+        if match2:
+            percentage = float(match2.group(1))
+            return percentage
+
+    return None
+
+
+def extract_percentage_social_media_users_populaton(soup):
+    ''' Returns the percentage of a population that uses social media.'''
+
+    if not soup:
+        print('Invalid soup')
+        # return None
+
+    for bold in soup.find_all("b"):
+
+        line = bold.parent.get_text(" ").lower()
+
+        if 'social media users' not in line or 'total population' not in line:
+            continue
+
+        match = re.search(r'\(([-+]?[\d\.]+)%\)', line)
+
+        if match:
+            percentage = float(match.group(1))
+            return percentage
+
+        match2 = re.search(r'([-+]?[\d\.]+)%', line)
+
+        if match2:
+            percentage = float(match2.group(1))
+            return percentage
+
+
+# The function of every metric (see extractor.METRICS).
+EXTRACTORS = {
+    'population': extract_population,
+    'social_media_users': extract_number_social_media_users,
+    'population_growth': get_ratio_population,
+    'users_growth': get_ratio_users,
+    'users_percentage': extract_percentage_social_media_users_populaton
+}
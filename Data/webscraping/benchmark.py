@@ -0,0 +1,93 @@
+'''
+This file benchmarks the parsing and the extractors of the datareportal pages
+on the fixture store (see fixtures.py), without any network access.
+
+Usage:
+    python benchmark.py [repeats]
+
+It reports the pages per second of every installed parser, and the time per
+page of the five separate extract functions of the first version (kept in
+baseline_extractors.py) and of extract_metrics, which finds all five metrics
+in one walk.
+'''
+
+import importlib.util
+import sys
+import time
+
+import baseline_extractors as baseline
+from extractor import extract_metrics, make_soup
+from fixtures import load_pages
+
+PARSERS = {'html.parser': None, 'lxml': 'lxml', 'html5lib': 'html5lib'}
+
+EXTRACTORS = {
+    'extract_population': baseline.extract_population,
+    'extract_number_social_media_users':
+        baseline.extract_number_social_media_users,
+    'get_ratio_population': baseline.get_ratio_population,
+    'get_ratio_users': baseline.get_ratio_users,
+    'extract_percentage_social_media_users_populaton':
+        baseline.extract_percentage_social_media_users_populaton,
+    'extract_metrics': extract_metrics
+}
+
+
+def installed_parsers():
+    return [parser for parser, module in PARSERS.items()
+            if module is None or importlib.util.find_spec(module)]
+
+
+def time_per_call(function, items, repeats):
+    ''' Returns the best average time of function over the items. '''
+    best = float('inf')
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, (time.perf_counter() - start) / len(items))
+
+    return best
+
+
+def benchmark(repeats=3):
+    '''
+    Returns a dictionary with the parse time per page of every parser, and
+    the extraction time per page of every extractor (in seconds).
+    '''
+    pages = list(load_pages().values())
+    results = {'pages': len(pages), 'parse': {}, 'extract': {}}
+
+    for parser in installed_parsers():
+        results['parse'][parser] = time_per_call(
+            lambda html: make_soup(html, parser), pages, repeats)
+
+    soups = [make_soup(html) for html in pages]
+    for name, extractor in EXTRACTORS.items():
+        results['extract'][name] = time_per_call(extractor, soups, repeats)
+
+    return results
+
+
+def report(results):
+    print(f"Benchmark on {results['pages']} fixture pages\n")
+
+    print(f"{'parser':<50}{'pages/s':>10}{'ms/page':>10}")
+    for parser, seconds in results['parse'].items():
+        print(f'{parser:<50}{1 / seconds:>10.1f}{seconds * 1000:>10.3f}')
+
+    print(f"\n{'extractor':<50}{'pages/s':>10}{'ms/page':>10}")
+    for name, seconds in results['extract'].items():
+        print(f'{name:<50}{1 / seconds:>10.1f}{seconds * 1000:>10.3f}')
+
+    separate = sum(seconds for name, seconds in results['extract'].items()
+                   if name != 'extract_metrics')
+    print(f"\nThe five baseline functions: {separate * 1000:.3f} ms/page, "
+          f"extract_metrics once: "
+          f"{results['extract']['extract_metrics'] * 1000:.3f} ms/page")
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    report(benchmark(repeats))
@@ -0,0 +1,104 @@
+'''
+This file implements the checkpoint of a crawl, so an interrupted crawl can
+be resumed and only the failed countries have to be fetched again.
+
+The checkpoint is a JSON Lines file with one record per processed country,
+appended (and flushed) as soon as the country is done:
+    {"country": ..., "url": ..., "status": "ok" or "failed",
+     "attempts": ..., "error": ..., "metrics": {...}, "time": ...}
+A later record of a country replaces the earlier ones. The failed records
+form the failure ledger.
+'''
+
+import json
+import time
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+
+def checkpoint_file(year):
+    ''' Returns the checkpoint file of the crawl of the reports of a year. '''
+    return BASE_DIR / f'Data/.cache/scrape_{year}.jsonl'
+
+
+CHECKPOINT_FILE = checkpoint_file(2021)
+
+
+class Checkpoint:
+    '''
+    Checkpoint of a crawl in a JSON Lines file.
+
+    Args:
+        path: the checkpoint file, it is created when it does not exist.
+    '''
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = Path(path)
+        self.records = self.load()
+
+    def load(self):
+        ''' Returns the last record of every country in the file. '''
+        records = {}
+
+        if not self.path.is_file():
+            return records
+
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line that was cut off by a crash.
+                    continue
+                records[record['country']] = record
+
+        return records
+
+    def append(self, country, url, metrics=None, error=None):
+        '''
+        Appends the result of a country. Without an error the country is
+        completed, with an error it is added to the failure ledger.
+        '''
+        previous = self.records.get(country, {})
+        record = {'country': country, 'url': url,
+                  'status': 'failed' if error else 'ok',
+                  'attempts': previous.get('attempts', 0) + 1,
+                  'error': error, 'metrics': metrics, 'time': time.time()}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+        self.records[country] = record
+        return record
+
+    def completed(self):
+        return {c for c, r in self.records.items() if r['status'] == 'ok'}
+
+    def failed(self):
+        ''' Returns the failure ledger: the failed record of every country. '''
+        return {c: r for c, r in self.records.items()
+                if r['status'] == 'failed'}
+
+    def pending(self, country_urls: dict, retry_failed=False):
+        '''
+        Returns the countries (and URLs) that still have to be fetched: the
+        missing ones, and with retry_failed also the failed ones.
+        '''
+        skip = self.completed() if retry_failed else set(self.records)
+        return {country: url for country, url in country_urls.items()
+                if country not in skip}
+
+    def results(self, country_urls: dict):
+        '''
+        Returns the metrics of every completed country, in the order of
+        country_urls.
+        '''
+        completed = self.completed()
+        return {country: self.records[country]['metrics']
+                for country in country_urls if country in completed}
+
+    def restart(self):
+        ''' Removes the checkpoint, so the next crawl starts from scratch. '''
+        self.path.unlink(missing_ok=True)
+        self.records = {}
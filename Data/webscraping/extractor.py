@@ -0,0 +1,212 @@
+'''
+This file implements the extraction of all metrics of a datareportal page in
+a single walk over its bold tags.
+
+The separate extract functions in webscraping.py each searched all bold
+tags again and recomputed the text of their parents. extract_metrics() walks
+the bold tags once, computes every text at most once and stops as soon as
+all metrics are found. The results are the same as those of the separate
+functions: every metric gets the value of the first bold tag that matches.
+
+The growth sentences refer to the year of the report and the year before,
+like 'between january 2020 and january 2021' in the 2021 reports. These
+phrases are generated for the year of the page (see year_phrases()).
+'''
+
+from functools import lru_cache
+import re
+
+from bs4 import BeautifulSoup
+
+MULTIPLIERS = {
+    'thousand': 10 ** 3,
+    'million': 10 ** 6,
+    'billion': 10 ** 9
+}
+
+# Percentages like '(+0.2%)' and '14%'.
+PERCENTAGE_IN_BRACKETS = re.compile(r'\(([-+]?[\d\.]+)%\)')
+PERCENTAGE = re.compile(r'([-+]?[\d\.]+)%')
+
+# Parser of BeautifulSoup. 'lxml' is several times faster, but needs the
+# lxml package (pip install lxml).
+PARSER = 'html.parser'
+
+YEAR = 2021  # the year of the reports in websites_2021.py
+
+METRICS = ('population', 'social_media_users', 'population_growth',
+           'users_growth', 'users_percentage')
+
+
+class PageMetrics:
+    '''
+    The metrics of one page, None if they could not be found.
+
+    Attributes:
+        population (int): total population.
+        social_media_users (int): number of social media users.
+        population_growth (float): growth of the population between
+            January of the year before and January of the report year (%).
+        users_growth (float): growth of the social media users between the
+            year before and the report year (%).
+        users_percentage (float): social media users as a percentage of the
+            total population.
+    '''
+    __slots__ = METRICS
+
+    def __init__(self):
+        for metric in METRICS:
+            setattr(self, metric, None)
+
+    def __repr__(self):
+        values = ', '.join(f'{metric}={getattr(self, metric)!r}'
+                           for metric in METRICS)
+        return f'PageMetrics({values})'
+
+    def as_dict(self):
+        return {metric: getattr(self, metric) for metric in METRICS}
+
+    def __eq__(self, other):
+        return (isinstance(other, PageMetrics) and
+                all(getattr(self, metric) == getattr(other, metric)
+                    for metric in METRICS))
+
+
+def make_soup(html, parser=PARSER):
+    ''' Parses a page with the given parser ('html.parser' or 'lxml'). '''
+    return BeautifulSoup(html, parser)
+
+
+def parse_number(bold_text):
+    ''' Converts a bold text like '17.15 million' to an integer. '''
+    splitted_text = bold_text.split()  # first value is the number
+    number = float(splitted_text[0].replace(',', '.'))
+
+    if len(splitted_text) > 1 and splitted_text[1] in MULTIPLIERS:
+        number *= MULTIPLIERS[splitted_text[1]]
+    else:
+        number *= 1000  # value is smaller than 10000
+
+    return int(number)
+
+
+def parse_percentage(sentence, brackets_only=False):
+    ''' Returns the first percentage in a sentence, or None. '''
+    match = PERCENTAGE_IN_BRACKETS.search(sentence)
+
+    if not match and not brackets_only:
+        match = PERCENTAGE.search(sentence)
+
+    return float(match.group(1)) if match else None
+
+
+@lru_cache(maxsize=None)
+def year_phrases(year=YEAR):
+    '''
+    Returns the phrases of the growth sentences in the report of a year, like
+    'between january 2020 and january 2021' for 2021.
+    '''
+    return {'population_growth': f'between january {year - 1} and january '
+                                 f'{year}',
+            'users_growth': f'between {year - 1} and {year}'}
+
+
+def match_population(bold, bold_text, sentence, phrases):
+    if any(c.isdigit() for c in bold_text) and 'population' in sentence:
+        return parse_number(bold_text)
+    return None
+
+
+def match_social_media_users(bold, bold_text, sentence, phrases):
+    if not any(c.isdigit() for c in bold_text):
+        return None
+
+    sibling = bold.next_sibling
+    if sibling and 'social media users' in sibling:
+        return parse_number(bold_text)
+    return None
+
+
+def match_population_growth(bold, bold_text, sentence, phrases):
+    if ('population' not in sentence or
+            phrases['population_growth'] not in sentence):
+        return None
+    if 'unchanged' in sentence:
+        return 0.0
+    return parse_percentage(sentence, brackets_only=True)
+
+
+def match_users_growth(bold, bold_text, sentence, phrases):
+    if ('social media users' not in sentence or
+            phrases['users_growth'] not in sentence):
+        return None
+    if 'unchanged' in sentence:
+        return 0.0
+    return parse_percentage(sentence)
+
+
+def match_users_percentage(bold, bold_text, sentence, phrases):
+    if ('social media users' not in sentence or
+            'total population' not in sentence):
+        return None
+    return parse_percentage(sentence)
+
+
+# For every metric: function(bold, bold_text, sentence, phrases) that returns
+# the value if the bold tag matches, and None otherwise.
+MATCHERS = {
+    'population': match_population,
+    'social_media_users': match_social_media_users,
+    'population_growth': match_population_growth,
+    'users_growth': match_users_growth,
+    'users_percentage': match_users_percentage
+}
+
+
+def extract_metrics(soup, year=YEAR):
+    '''
+    Extracts all metrics of a page in one walk over the bold tags.
+
+    Args:
+        soup: the parsed page (or None).
+        year: the year of the report.
+
+    Returns:
+        A PageMetrics record. A metric whose number can not be parsed is
+        left None.
+    '''
+    metrics = PageMetrics()
+
+    if not soup:
+        return metrics
+
+    pending = list(METRICS)
+    phrases = year_phrases(year)
+
+    for bold in soup.find_all('b'):
+        sentence = bold.parent.get_text(" ").lower()
+
+        # Every metric needs one of these phrases in the sentence (the next
+        # sibling of the bold tag is a part of the sentence as well).
+        if ('population' not in sentence and
+                'social media users' not in sentence):
+            continue
+
+        bold_text = bold.get_text(" ").lower().strip()
+
+        for metric in list(pending):
+            try:
+                value = MATCHERS[metric](bold, bold_text, sentence, phrases)
+            except ValueError:
+                # A number that can not be parsed ends the search.
+                pending.remove(metric)
+                continue
+
+            if value is not None:
+                setattr(metrics, metric, value)
+                pending.remove(metric)
+
+        if not pending:
+            break
+
+    return metrics
@@ -0,0 +1,274 @@
+'''
+This file implements the fetch policy of the scraper: how politely and how
+persistently the pages are requested.
+
+ - Every request has a connect and a read timeout.
+ - A token bucket limits the number of requests per second.
+ - 429 and 5xx responses, timeouts, connection errors and other failed
+   requests (like a download that breaks off) are retried with jittered
+   exponential backoff (respecting a Retry-After header). Invalid requests
+   (like a malformed URL) are not retried.
+ - A circuit breaker stops all requests for a while after too many failures
+   in a row, instead of hammering a host that is down or rate limiting us.
+ - The number of concurrent requests adapts to the observed latency: it
+   grows by one while responses are fast, and halves when they are slow or
+   the host pushes back.
+'''
+
+import random
+import threading
+import time
+
+import requests
+
+from instrumentation import instruments
+
+TIMEOUT = (5, 30)       # connect and read timeout (seconds)
+RATE = 5.0              # requests per second
+BURST = 10              # requests that may be sent at once
+MAX_RETRIES = 4         # retries after the first attempt
+BACKOFF_BASE = 0.5      # seconds, doubled for every retry
+BACKOFF_CAP = 30.0      # longest wait between two attempts
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    ''' Raised when the circuit breaker does not allow any requests. '''
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limiter: `rate` tokens are added per second, up to
+    `burst` tokens, and every request takes one token.
+    '''
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ''' Waits until a token is available and takes it. '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens
+                                  + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    '''
+    Opens after `threshold` failures in a row, and then refuses requests for
+    `reset_timeout` seconds. After that one trial request is let through
+    (half-open): a success closes the circuit, a failure opens it again.
+    '''
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        ''' Returns whether a request may be sent now. '''
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class AdaptiveLimit:
+    '''
+    Limits the number of concurrent requests with additive increase and
+    multiplicative decrease (AIMD) on the observed latency.
+
+    Args:
+        minimum, maximum: bounds of the limit.
+        target_latency: responses slower than this (seconds) lower the limit.
+    '''
+    def __init__(self, minimum=1, maximum=8, target_latency=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.limit = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        '''
+        Frees a slot. A slow or overloaded response halves the limit, a fast
+        one raises it by one (spread over the current limit).
+        '''
+        with self.condition:
+            self.in_flight -= 1
+
+            if overloaded or (latency is not None
+                              and latency > self.target_latency):
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+
+def backoff_delay(attempt, response=None, base=BACKOFF_BASE, cap=BACKOFF_CAP,
+                  rng=random):
+    '''
+    Returns the wait before retry number `attempt` (0 for the first retry):
+    a random time up to base * 2^attempt ("full jitter"), or the Retry-After
+    time of the response if that is longer.
+    '''
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+
+    retry_after = None
+    if response is not None:  # an error response is falsy
+        retry_after = response.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(cap, float(retry_after)))
+
+    return delay
+
+
+class FetchPolicy:
+    '''
+    Combines the timeouts, rate limit, retries, circuit breaker and adaptive
+    concurrency limit. One policy is shared by all fetching threads.
+    '''
+    def __init__(self, timeout=TIMEOUT, rate=RATE, burst=BURST,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 breaker=None, limit=None, seed=None):
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker or CircuitBreaker()
+        self.limit = limit or AdaptiveLimit()
+        self.rng = random.Random(seed)
+
+    def request(self, session, url, headers=None):
+        '''
+        Sends a GET request following the policy.
+
+        Returns:
+            The last response. Responses with a status that is not retried
+            (like 404) are returned directly, the caller checks them.
+
+        Raises:
+            requests.RequestException when all attempts failed, or
+            CircuitOpenError when the circuit breaker is open.
+        '''
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                instruments.count('request.circuit_open')
+                raise CircuitOpenError(f'Circuit open, skipped {url}')
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+            self.limit.acquire()
+            start = time.monotonic()
+            response = error = None
+
+            try:
+                response = session.get(url, headers=headers,
+                                       timeout=self.timeout)
+            except requests.RequestException as exc:
+                # Every failure is recorded below, also of a half-open trial
+                # request, otherwise the circuit breaker stays half-open.
+                error = exc
+            finally:
+                latency = time.monotonic() - start
+                overloaded = error is not None or (
+                    response is not None
+                    and response.status_code in RETRY_STATUSES)
+                self.limit.release(latency, overloaded)
+
+            if instruments.enabled:
+                record_request(response, error, latency)
+
+            if not overloaded:
+                self.breaker.record_success()
+                return response
+
+            self.breaker.record_failure()
+            if attempt == self.max_retries or isinstance(error, ValueError):
+                # Invalid URLs, schemas and headers fail again on a retry.
+                break
+
+            instruments.count('request.retries')
+            time.sleep(backoff_delay(attempt, response, self.backoff_base,
+                                     rng=self.rng))
+
+        if error is not None:
+            raise error
+        return response
+
+
+def record_request(response, error, latency):
+    ''' Records the timings, size and status of a request. '''
+    instruments.record('request.latency', latency)
+
+    if response is None:
+        instruments.count(f'request.error.{type(error).__name__}')
+        return
+
+    # elapsed is the time until the headers arrived: connecting (and DNS)
+    # plus the server. The rest of the latency is the download.
+    ttfb = response.elapsed.total_seconds()
+    instruments.record('request.ttfb', ttfb)
+    instruments.record('request.download', max(0.0, latency - ttfb))
+    instruments.count('request.bytes', len(response.content))
+    instruments.count(f'request.status.{response.status_code}')
+
+
+class PolicySession:
+    '''
+    Wraps a requests.Session so that its get() follows a FetchPolicy, for
+    code that expects a session (like PageCache.fetch).
+    '''
+    def __init__(self, session, policy):
+        self.session = session
+        self.policy = policy
+
+    def get(self, url, headers=None):
+        return self.policy.request(self.session, url, headers)
@@ -0,0 +1,92 @@
+'''
+This file implements the fetch layer of the webscraping. The pages are
+downloaded by a bounded number of threads, every thread reusing the
+connections of its own requests.Session. The results are always returned in
+the order of the URLs, no matter which download finishes first.
+
+The requests follow a FetchPolicy (see fetch_policy.py): timeouts, a rate
+limit, retries with backoff, a circuit breaker and a concurrency limit that
+adapts to the latency of the host.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetch_policy import AdaptiveLimit, FetchPolicy, PolicySession
+
+MAX_WORKERS = 8  # number of pages that are downloaded at the same time
+
+# The policy shared by all threads, its concurrency limit never exceeds the
+# number of workers.
+default_policy = FetchPolicy(limit=AdaptiveLimit(maximum=MAX_WORKERS))
+
+# Every thread gets its own session, requests.Session is not thread-safe.
+local = threading.local()
+
+
+def get_session():
+    ''' Returns the pooled requests.Session of the current thread. '''
+    session = getattr(local, 'session', None)
+
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        local.session = session
+
+    return session
+
+
+def fetch(url, cache=None, policy=default_policy):
+    '''
+    Returns the HTML of a page, or None if it could not be fetched. Given a
+    PageCache (see page_cache.py), the page is served from the cache when
+    possible. policy=None sends a single request without any limits.
+    '''
+    session = get_session()
+    if policy is not None:
+        session = PolicySession(session, policy)
+
+    if cache is not None:
+        return cache.fetch(url, session)
+
+    try:
+        response = session.get(url)
+        response.raise_for_status()
+        return response.text
+    except requests.RequestException:
+        return None
+
+
+def fetch_all(urls, workers=MAX_WORKERS, fetch=fetch):
+    '''
+    Fetches all URLs with at most `workers` threads.
+
+    Args:
+        urls: iterable with the URLs.
+        workers: maximum number of concurrent downloads (1 downloads them
+            one by one in this thread).
+        fetch: function that downloads one URL.
+
+    Returns:
+        An iterator over the pages (or None for failures), in the order of
+        the URLs.
+    '''
+    urls = list(urls)
+
+    if workers <= 1:
+        return map(fetch, urls)
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, max(len(urls), 1)))
+
+    def ordered():
+        try:
+            yield from executor.map(fetch, urls)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return ordered()
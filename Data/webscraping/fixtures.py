@@ -0,0 +1,308 @@
+'''
+This file manages the fixture store of saved datareportal pages, used to test
+and benchmark the extractors without network access.
+
+The store is the folder fixtures/ with one gzipped page per country
+(<page name>.html.gz, the last part of its URL) and expected.json with the
+URL, the expected metrics and the source ('recorded' or 'reconstructed') of
+every page. The stub server (stub_server.py) serves the folder directly.
+
+Two ways to fill the store:
+ - record_fixtures(): downloads the live pages and stores the metrics that
+   the extractor finds on them, to catch regressions of later changes.
+ - reconstruct_fixtures(): rebuilds pages in the wording of the reports
+   from the values in the Data/ CSVs (which were scraped from the live
+   pages), for when datareportal.com can not be reached. Recorded pages
+   are never replaced by reconstructions.
+
+The reconstructed pages are written to match the extractor, so they only
+catch regressions together with the recorded pages and the checks against
+the first version of the extractors (baseline_extractors.py) in
+webscraping.tests(). Record at least one live page with:
+
+    python fixtures.py record Netherlands
+'''
+
+import gzip
+import json
+import sys
+
+import pandas as pd
+
+from extractor import (extract_metrics, make_soup, parse_number, METRICS,
+                       YEAR)
+from fetching import fetch
+from websites_2021 import country_urls2021
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+EXPECTED_FILE = 'expected.json'
+
+# The pages of the assertions in webscraping.tests(), with the values that
+# were checked on the live pages.
+TEST_PAGES = {
+    'Netherlands': {'population': 17150000, 'social_media_users': 15100000,
+                    'population_growth': 0.2, 'users_growth': 0.0,
+                    'users_percentage': 88.0},
+    'Christmas Island': {'population': 1843, 'social_media_users': 1200,
+                         'population_growth': 0.0, 'users_growth': None,
+                         'users_percentage': 65.1},
+    'Albania': {'population': 2880000, 'social_media_users': 1600000,
+                'population_growth': -0.1, 'users_growth': 14.0,
+                'users_percentage': 55.6}
+}
+
+SAMPLE_STEP = 6  # reconstruct every 6th country besides the test pages
+
+
+def page_name(url):
+    ''' Returns the name of a page, like 'digital-2021-netherlands'. '''
+    return url.rstrip('/').split('/')[-1]
+
+
+def save_page(html, name, folder=FIXTURES_DIR):
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    # mtime=0 keeps the files identical when they are saved again.
+    with open(folder / f'{name}.html.gz', 'wb') as file:
+        file.write(gzip.compress(html.encode('utf-8'), mtime=0))
+
+
+def load_page(name, folder=FIXTURES_DIR):
+    with gzip.open(Path(folder) / f'{name}.html.gz', 'rb') as file:
+        return file.read().decode('utf-8')
+
+
+def load_expected(folder=FIXTURES_DIR):
+    '''
+    Returns a dictionary with the countries as keys and dictionaries with
+    the 'url' and the expected 'metrics' as values.
+    '''
+    with open(Path(folder) / EXPECTED_FILE) as file:
+        return json.load(file)
+
+
+def save_expected(expected, folder=FIXTURES_DIR):
+    with open(Path(folder) / EXPECTED_FILE, 'w') as file:
+        json.dump(expected, file, indent=1)
+        file.write('\n')
+
+
+def recorded_countries(expected):
+    ''' Returns the countries of which the live page was recorded. '''
+    return [country for country, entry in expected.items()
+            if entry.get('source') == 'recorded']
+
+
+def load_pages(folder=FIXTURES_DIR):
+    ''' Returns a dictionary with the saved page of every country. '''
+    return {country: load_page(page_name(entry['url']), folder)
+            for country, entry in load_expected(folder).items()}
+
+
+def record_fixtures(country_urls: dict, folder=FIXTURES_DIR):
+    '''
+    Downloads the pages of the countries and stores them, together with the
+    metrics that the extractor currently finds on them. The other pages in
+    the store are kept.
+    '''
+    folder = Path(folder)
+    expected = {}
+    if (folder / EXPECTED_FILE).exists():
+        expected = load_expected(folder)
+
+    for country, url in country_urls.items():
+        html = fetch(url)
+        if html is None:
+            print(f'Could not record {country}')
+            continue
+
+        metrics = extract_metrics(make_soup(html))
+        save_page(html, page_name(url), folder)
+        expected[country] = {'url': url, 'metrics': metrics.as_dict(),
+                             'source': 'recorded'}
+
+    save_expected(expected, folder)
+    return expected
+
+
+'''
+Reconstructed pages.
+'''
+
+
+def format_number(number):
+    ''' Writes a number the way the reports do, like '17.15 million'. '''
+    if number >= 10 ** 6:
+        return f'{number / 10 ** 6:.2f} million'
+    if number >= 10 ** 4:
+        return f'{number / 10 ** 3:.1f} thousand'
+    return f'{number:,}'
+
+
+def sentence(text, value):
+    return f'<p>{text.replace("{}", f"<b>{value}</b>")}</p>'
+
+
+def reconstruct_page(country, metrics, year=YEAR):
+    '''
+    Builds the report page of a year with the given metrics. Metrics that
+    are None are left out. The sentences are followed by other statistics
+    in bold, like on the real pages.
+    '''
+    the = f'the {country}' if country == 'Netherlands' else country
+    before = year - 1
+    parts = [f'<html><head><title>Digital {year}: {country}</title></head>',
+             '<body><nav><b>DataReportal</b> <a href="/">Reports</a></nav>',
+             f'<article><h1>Digital {year}: {country}</h1>']
+
+    population = metrics['population']
+    if population is not None:
+        parts.append(sentence(f'The population of {the} stood at {{}} in '
+                              f'January {year}.', format_number(population)))
+
+    growth = metrics['population_growth']
+    if growth == 0.0:
+        parts.append(sentence(f'The population of {the} was {{}} between '
+                              f'January {before} and January {year}.',
+                              'unchanged'))
+    elif growth is not None:
+        change = 'increased' if growth > 0 else 'decreased'
+        parts.append(sentence(f'The population of {the} {{}} by '
+                              f'{abs(growth):g} percent ({growth:+g}%) '
+                              f'between January {before} and January {year}.',
+                              change))
+
+    users = metrics['social_media_users']
+    if users is not None:
+        parts.append(f'<p>There were <b>{format_number(users)}</b> social '
+                     f'media users in {the} in January {year}.</p>')
+
+    growth = metrics['users_growth']
+    if growth == 0.0:
+        parts.append(sentence(f'The number of social media users in {the} '
+                              f'was {{}} between {before} and {year}.',
+                              'unchanged'))
+    elif growth is not None and users is not None:
+        change = int(users * abs(growth) / (100 + growth))
+        parts.append(sentence(f'The number of social media users in {the} '
+                              f'changed by {{}} ({growth:+g}%) between '
+                              f'{before} and {year}.', format_number(change)))
+    elif growth is not None:
+        parts.append(sentence(f'The number of social media users in {the} '
+                              f'changed by {{}} between {before} and {year}.',
+                              f'{growth:+g}%'))
+
+    percentage = metrics['users_percentage']
+    if percentage is not None:
+        parts.append(sentence(f'The number of social media users in {the} at '
+                              f'the start of {year} was equivalent to {{}} of '
+                              'the total population.', f'{percentage:g}%'))
+
+    # Other statistics of the report, which the extractor has to skip.
+    for i in range(40):
+        parts.append(f'<p>Statistic {i + 1} of the report showed <b>{i + 2}.'
+                     f'{i % 10} million</b> connections in {the}, up '
+                     f'<b>{i % 7}.{i % 3}%</b> on the year before.</p>')
+
+    parts.append('</article><footer><b>Kepios</b></footer></body></html>')
+    return '\n'.join(parts)
+
+
+def csv_metrics():
+    ''' Returns the metrics of every country in the Data/ CSVs. '''
+    ratios = pd.read_csv(BASE_DIR / 'Data/ratios_countries_social_media.csv')
+    percentages = pd.read_csv(BASE_DIR /
+                              'Data/percentages_population_users.csv')
+    users = pd.read_csv(BASE_DIR / 'Data/social_media_users_2021.csv')
+
+    data = (users.merge(percentages, on='Country', how='left')
+            .merge(ratios, on='Country', how='left'))
+
+    def value(x):
+        return None if pd.isna(x) else x
+
+    metrics = {}
+    for row in data.itertuples(index=False):
+        n_users = value(row[1])
+        percentage = value(row[2])
+        population = None
+        if n_users is not None and percentage:
+            population = parse_number(format_number(
+                int(n_users / percentage * 100)).lower())
+
+        metrics[row[0]] = {
+            'population': population,
+            'social_media_users': None if n_users is None else int(n_users),
+            'population_growth': value(row[3]),
+            'users_growth': value(row[4]),
+            'users_percentage': percentage}
+    return metrics
+
+
+def reconstruct_fixtures(folder=FIXTURES_DIR, step=SAMPLE_STEP):
+    '''
+    Rebuilds the fixture store from the test pages and every step-th
+    country in the Data/ CSVs. The recorded pages in the store are kept.
+
+    Raises:
+        ValueError listing every page of which the extractor does not find
+        the values back, before anything is written.
+    '''
+    folder = Path(folder)
+    expected = {}
+    if (folder / EXPECTED_FILE).exists():
+        expected = load_expected(folder)
+    recorded = recorded_countries(expected)
+    expected = {country: expected[country] for country in recorded}
+
+    metrics = csv_metrics()
+    countries = [c for c in country_urls2021 if c in metrics]
+    sample = dict(TEST_PAGES)
+    sample.update({c: metrics[c] for c in countries[::step]
+                   if c not in sample})
+
+    pages = {}
+    failures = []
+    for country, values in sample.items():
+        if country in recorded:
+            continue
+
+        html = reconstruct_page(country, values)
+        found = extract_metrics(make_soup(html))
+        for metric in METRICS:
+            if getattr(found, metric) != values[metric]:
+                failures.append(f'{country} {metric}: expected '
+                                f'{values[metric]}, found '
+                                f'{getattr(found, metric)}')
+        pages[country] = html
+
+    if failures:
+        raise ValueError('The values of these pages do not round trip:\n' +
+                         '\n'.join(failures))
+
+    for country, html in pages.items():
+        url = country_urls2021[country]
+        save_page(html, page_name(url), folder)
+        expected[country] = {'url': url, 'metrics': sample[country],
+                             'source': 'reconstructed'}
+
+    save_expected(expected, folder)
+    return expected
+
+
+if __name__ == "__main__":
+    # python fixtures.py record [countries]: records the live pages of the
+    # countries (default all pages in the store).
+    # python fixtures.py: reconstructs the pages that were not recorded.
+    if sys.argv[1:2] == ['record']:
+        countries = sys.argv[2:] or list(load_expected())
+        expected = record_fixtures({c: country_urls2021[c]
+                                    for c in countries})
+    else:
+        expected = reconstruct_fixtures()
+
+    print(f'Stored {len(expected)} pages in {FIXTURES_DIR}, '
+          f'{len(recorded_countries(expected))} recorded')
@@ -0,0 +1,229 @@
+'''
+This file implements the instrumentation of the scraping pipeline: timings
+(latency histograms) and counters of the requests, the page cache, the
+parsing and the extractors.
+
+The instrumentation is disabled by default, then every hook is a single
+attribute check. Enable it with `instruments.enabled = True` (or
+python webscraping.py --instrument). Every procedure decorated with
+@procedure then prints a JSON summary when it is done, and appends it to
+Data/.cache/metrics.jsonl.
+
+Names of the timings and counters:
+    request.latency, request.ttfb, request.download
+                                    whole request / until the headers / rest
+    request.bytes, request.status.<code>, request.retries,
+    request.circuit_open, request.error.<exception>
+    cache.hit, cache.miss, cache.revalidate (expired), cache.revalidated
+    (304), cache.stale, cache.failed, cache.offline_miss
+    fetch, parse, fetch.failed      download (or cache) and parse of a page
+    extract.<function>              time of an extract function
+    extract.<function>.calls, extract.<function>.missing,
+    extract.invalid_soup
+    metric.<metric>.pages, metric.<metric>.missing   crawl results
+'''
+
+from bisect import bisect_left
+from contextlib import nullcontext
+import functools
+import json
+import threading
+import time
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+METRICS_FILE = BASE_DIR / 'Data/.cache/metrics.jsonl'
+
+# Upper bounds of the buckets of the histograms (seconds).
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10,
+           30, float('inf'))
+
+
+class Histogram:
+    ''' Histogram of durations with fixed buckets (see BUCKETS). '''
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        ''' Returns the upper bound of the bucket of quantile q. '''
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'total_s': round(self.total, 6),
+                'mean_ms': round(self.total / self.count * 1000, 3),
+                'min_ms': round(self.min * 1000, 3),
+                'max_ms': round(self.max * 1000, 3),
+                'p50_ms': round(self.quantile(0.5) * 1000, 3),
+                'p95_ms': round(self.quantile(0.95) * 1000, 3),
+                'buckets': {f'<={bound * 1000:g}ms': count for bound, count
+                            in zip(BUCKETS, self.counts) if count}}
+
+
+class Timer:
+    ''' Context manager that records its duration in a histogram. '''
+    __slots__ = ('instruments', 'name', 'start')
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instruments.record(self.name, time.perf_counter() - self.start)
+
+
+NULL_TIMER = nullcontext()
+
+
+class Instruments:
+    '''
+    Thread-safe collection of histograms and counters.
+
+    Attributes:
+        enabled: whether anything is recorded.
+        path: file the summaries are appended to (None only prints them).
+    '''
+    def __init__(self, enabled=False, path=METRICS_FILE):
+        self.enabled = enabled
+        self.path = path
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.perf_counter()
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        ''' Returns a context manager that times its block. '''
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def summary(self, procedure=None):
+        ''' Returns the timings, counters and failure rates as a dict. '''
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+            timings = {name: histogram.summary()
+                       for name, histogram in sorted(self.histograms.items())}
+            summary = {'procedure': procedure,
+                       'wall_s': round(time.perf_counter() - self.started, 3),
+                       'timings': timings,
+                       'counters': counters}
+
+        # The share of the calls (or pages) that found nothing.
+        rates = {}
+        for name, missing in counters.items():
+            if name.endswith('.missing'):
+                prefix = name[:-len('.missing')]
+                total = counters.get(f'{prefix}.calls',
+                                     counters.get(f'{prefix}.pages'))
+                if total:
+                    rates[prefix] = round(missing / total, 4)
+        summary['failure_rates'] = rates
+
+        return summary
+
+    def emit(self, procedure):
+        ''' Prints the summary as JSON and appends it to the metrics file. '''
+        summary = self.summary(procedure)
+        line = json.dumps(summary)
+        print(json.dumps(summary, indent=1))
+
+        if self.path is not None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as file:
+                file.write(line + '\n')
+
+        return summary
+
+
+# The instruments shared by the whole pipeline.
+instruments = Instruments()
+
+# Depth of the running procedures, only the outermost one emits a summary.
+local = threading.local()
+
+
+def procedure(function):
+    '''
+    Decorator for the scrape procedures: with the instrumentation enabled,
+    the instruments are reset before and a summary is emitted after the
+    procedure.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        depth = getattr(local, 'depth', 0)
+        if not instruments.enabled or depth:
+            return function(*args, **kwargs)
+
+        instruments.reset()
+        local.depth = 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            local.depth = 0
+            instruments.emit(function.__name__)
+
+    return wrapper
+
+
+def extractor(function):
+    '''
+    Decorator for the extract functions of a soup: times them, and counts
+    the calls, the invalid soups and the results that are None.
+    '''
+    name = f'extract.{function.__name__}'
+
+    @functools.wraps(function)
+    def wrapper(soup):
+        if not instruments.enabled:
+            return function(soup)
+
+        with Timer(instruments, name):
+            value = function(soup)
+
+        instruments.count(f'{name}.calls')
+        if not soup:
+            instruments.count('extract.invalid_soup')
+        if value is None:
+            instruments.count(f'{name}.missing')
+        return value
+
+    return wrapper
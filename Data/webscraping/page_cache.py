@@ -0,0 +1,159 @@
+'''
+This file implements a persistent on-disk cache for the downloaded pages, so
+the scrape procedures fetch every page only once.
+
+The cache is content-addressed: the pages are stored gzipped under the sha1
+hash of their content, and an index entry per URL points to the content
+together with the ETag and Last-Modified headers of the response. Within the
+TTL a cached page is used without any request. After the TTL the page is
+revalidated with a conditional request, and a 304 response keeps the cached
+copy. In offline mode only cached pages are used.
+'''
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+from instrumentation import instruments
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+CACHE_DIR = BASE_DIR / 'Data/.cache/pages'
+TTL = 7 * 24 * 3600  # seconds a cached page is used without revalidation
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def write_atomic(path, data):
+    ''' Writes bytes to a file through a temporary file in the same folder. '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.replace(tmp, path)
+
+
+class PageCache:
+    '''
+    On-disk page cache keyed by URL.
+
+    Args:
+        folder: folder of the cache.
+        ttl: seconds a cached page is used without revalidation (None never
+            revalidates).
+        offline: only serve pages from the cache, never use the network.
+    '''
+    def __init__(self, folder=CACHE_DIR, ttl=TTL, offline=False):
+        self.folder = Path(folder)
+        self.ttl = ttl
+        self.offline = offline
+
+    def index_path(self, url):
+        return self.folder / 'index' / f'{sha1(url.encode())}.json'
+
+    def content_path(self, digest):
+        return self.folder / 'objects' / f'{digest}.html.gz'
+
+    def lookup(self, url):
+        ''' Returns the index entry of a URL, or None if it is not cached. '''
+        try:
+            with open(self.index_path(url)) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not self.content_path(entry['sha1']).is_file():
+            return None
+        return entry
+
+    def read(self, entry):
+        ''' Returns the cached page of an index entry. '''
+        with gzip.open(self.content_path(entry['sha1']), 'rb') as file:
+            return file.read().decode(entry.get('encoding') or 'utf-8')
+
+    def get(self, url):
+        ''' Returns the cached page of a URL (ignoring the TTL), or None. '''
+        entry = self.lookup(url)
+        return None if entry is None else self.read(entry)
+
+    def store(self, url, response):
+        ''' Stores the page of a (200) response and returns its entry. '''
+        content = response.content
+        digest = sha1(content)
+
+        # Identical pages are stored only once.
+        path = self.content_path(digest)
+        if not path.is_file():
+            write_atomic(path, gzip.compress(content))
+
+        entry = {'url': url, 'sha1': digest,
+                 'encoding': response.encoding,
+                 'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified'),
+                 'fetched_at': time.time()}
+        self.write_entry(url, entry)
+        return entry
+
+    def write_entry(self, url, entry):
+        write_atomic(self.index_path(url), json.dumps(entry).encode())
+
+    def is_fresh(self, entry):
+        return self.ttl is None or time.time() - entry['fetched_at'] < self.ttl
+
+    def fetch(self, url, session):
+        '''
+        Returns the page of a URL, from the cache if possible.
+
+        Args:
+            url: the URL of the page.
+            session: the requests.Session used for (conditional) requests.
+
+        Returns:
+            The HTML of the page, or None if it is neither cached nor could
+            be downloaded.
+        '''
+        entry = self.lookup(url)
+
+        if entry is not None and (self.offline or self.is_fresh(entry)):
+            instruments.count('cache.hit')
+            return self.read(entry)
+        if self.offline:
+            instruments.count('cache.offline_miss')
+            return None
+
+        instruments.count('cache.miss' if entry is None else
+                          'cache.revalidate')
+
+        # Revalidate the cached copy with a conditional request.
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = session.get(url, headers=headers)
+
+            if response.status_code == 304 and entry is not None:
+                instruments.count('cache.revalidated')
+                entry['fetched_at'] = time.time()
+                self.write_entry(url, entry)
+                return self.read(entry)
+
+            response.raise_for_status()
+        except requests.RequestException:
+            # Better a stale page than no page.
+            instruments.count('cache.stale' if entry else 'cache.failed')
+            return None if entry is None else self.read(entry)
+
+        self.store(url, response)
+        return response.text
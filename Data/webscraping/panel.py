@@ -0,0 +1,86 @@
+'''
+This file stores the scraped metrics as a long-format panel with one row per
+country and year. The panel is partitioned by year: every year is a separate
+CSV file (Data/panel/year=<year>.csv), so a new year is scraped and stored
+without touching the years that are already stored.
+
+Usage:
+    data = read_panel()                 # all stored years
+    data = read_panel([2020, 2021])
+'''
+
+import os
+
+import pandas as pd
+
+from extractor import METRICS
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+PANEL_DIR = BASE_DIR / 'Data/panel'
+
+# The header of every metric, in the wording of the other CSVs in Data/.
+HEADERS = {
+    'population': 'Population (N)',
+    'social_media_users': 'Social Media Users (N)',
+    'population_growth': 'Population Growth (%)',
+    'users_growth': 'Social Media Users Growth (%)',
+    'users_percentage': 'Social Media Users (%)'
+}
+
+
+def partition_path(year, folder=PANEL_DIR):
+    return Path(folder) / f'year={year}.csv'
+
+
+def stored_years(folder=PANEL_DIR):
+    ''' Returns the years that are stored in the panel, in order. '''
+    return sorted(int(path.stem.split('=')[1])
+                  for path in Path(folder).glob('year=*.csv'))
+
+
+def missing_years(years, folder=PANEL_DIR):
+    ''' Returns the years of the list that are not stored yet. '''
+    stored = set(stored_years(folder))
+    return [year for year in years if year not in stored]
+
+
+def write_partition(year, results: dict, folder=PANEL_DIR):
+    '''
+    Stores the metrics of one year, replacing the partition of that year.
+
+    Args:
+        year: the year of the reports.
+        results: dictionary with the countries as keys and dictionaries
+            with the metrics (see extractor.METRICS) as values.
+    '''
+    rows = [{'Country': country, 'Year': year,
+             **{HEADERS[m]: metrics.get(m) for m in METRICS}}
+            for country, metrics in results.items()]
+    data = pd.DataFrame(rows, columns=['Country', 'Year',
+                                       *(HEADERS[m] for m in METRICS)])
+
+    # Write to a temporary file first, so an interrupted write never leaves
+    # a partial partition behind.
+    path = partition_path(year, folder)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    data.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def read_panel(years=None, folder=PANEL_DIR):
+    '''
+    Returns the panel (Country, Year and a column per metric) of the given
+    years, or of all stored years. Years that are not stored are skipped.
+    '''
+    years = stored_years(folder) if years is None else years
+    paths = [partition_path(year, folder) for year in years]
+    frames = [pd.read_csv(path) for path in paths if path.is_file()]
+
+    if not frames:
+        return pd.DataFrame(columns=['Country', 'Year',
+                                     *(HEADERS[m] for m in METRICS)])
+    return pd.concat(frames, ignore_index=True)
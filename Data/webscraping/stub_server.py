@@ -0,0 +1,205 @@
+'''
+This file implements a local HTTP stub server that serves saved pages, so the
+scraper can be tested without access to datareportal.com.
+
+Usage:
+    with StubServer('fixtures') as server:
+        urls = local_urls(country_urls2021, server.base_url)
+        ...
+
+A request for /reports/<name> is answered with <folder>/<name>.html (or the
+gzipped <name>.html.gz), other paths get a 404.
+
+Faults can be injected to test the fetch policy (see fetch_policy.py):
+    with StubServer('fixtures', Faults(delay=0.5, fail_first=2)) as server:
+        ...
+    with StubServer('fixtures', Faults(truncate_first=1)) as server:
+'''
+
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from pathlib import Path
+
+
+def local_urls(country_urls: dict, base_url):
+    ''' Returns the URLs with their scheme and host replaced by base_url. '''
+    base = urlsplit(base_url)
+    return {country: urlunsplit(urlsplit(url)._replace(scheme=base.scheme,
+                                                       netloc=base.netloc))
+            for country, url in country_urls.items()}
+
+
+def read_page(folder, name):
+    ''' Returns the saved page with the given name, or None. '''
+    for path, opener in [(folder / f'{name}.html', open),
+                         (folder / f'{name}.html.gz', gzip.open)]:
+        if path.is_file():
+            with opener(path, 'rb') as file:
+                return file.read()
+    return None
+
+
+class Faults:
+    '''
+    Faults injected by the stub server.
+
+    Args:
+        delay: seconds every response is delayed.
+        fail_first: the first requests of every page that get an error.
+        truncate_first: the next requests of every page whose connection
+            is dropped halfway through the page.
+        error_rate: the chance that any other request gets an error.
+        statuses: the error statuses, chosen at random.
+        retry_after: Retry-After header (seconds) of 429 responses.
+        seed: seed of the random errors.
+    '''
+    def __init__(self, delay=0.0, fail_first=0, error_rate=0.0,
+                 statuses=(429, 503), retry_after=None, seed=None,
+                 truncate_first=0):
+        self.delay = delay
+        self.fail_first = fail_first
+        self.truncate_first = truncate_first
+        self.error_rate = error_rate
+        self.statuses = statuses
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+
+    def error(self, hits):
+        ''' Returns the error status for the hits-th request, or None. '''
+        if hits <= self.fail_first or self.rng.random() < self.error_rate:
+            return self.rng.choice(self.statuses)
+        return None
+
+    def truncated(self, hits):
+        ''' Returns whether the hits-th request gets half the page. '''
+        return 0 < hits - self.fail_first <= self.truncate_first
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        name = urlsplit(self.path).path.rstrip('/').split('/')[-1]
+
+        with server.lock:
+            server.hits[name] = server.hits.get(name, 0) + 1
+            hits = server.hits[name]
+            faults = server.faults
+            error = faults.error(hits) if faults else None
+            truncated = bool(faults) and faults.truncated(hits)
+
+        if faults and faults.delay:
+            time.sleep(faults.delay)
+
+        if error is not None:
+            self.send_response(error)
+            if error == 429 and faults.retry_after is not None:
+                self.send_header('Retry-After', str(faults.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        page = read_page(server.folder, name) if name else None
+
+        if page is None:
+            self.send_error(404)
+            return
+
+        # Support revalidation of cached pages.
+        etag = '"' + hashlib.sha1(page).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+
+        if truncated:
+            # Announce the whole page, but close after half of it.
+            page = page[:len(page) // 2]
+            self.close_connection = True
+        try:
+            self.wfile.write(page)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. after its read timeout.
+            pass
+
+    def log_message(self, format, *args):
+        # Keep the output of the scraper readable.
+        pass
+
+
+class StubServer:
+    '''
+    Serves the pages in a folder on a free local port, in a background
+    thread. Use as a context manager, the server stops when leaving it.
+
+    Attributes:
+        base_url: the URL of the server, like 'http://127.0.0.1:8123'.
+        hits: dictionary with the number of requests per page name.
+
+    Args:
+        folder: folder with the pages.
+        faults: Faults to inject, None serves every page directly.
+        port: port of the server, 0 picks a free port.
+    '''
+    handler = StubHandler
+
+    def __init__(self, folder, faults=None, port=0):
+        self.folder = Path(folder)
+        self.faults = faults
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port),
+                                          self.handler)
+        self.server.daemon_threads = True
+        self.server.folder = self.folder
+        self.server.hits = {}
+        self.server.faults = self.faults
+        self.server.lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def hits(self):
+        return self.server.hits
+
+
+if __name__ == "__main__":
+    # Serve a folder until interrupted: python stub_server.py <folder> [port]
+    folder = sys.argv[1] if len(sys.argv) > 1 else '.'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+
+    with StubServer(folder, port=port) as stub:
+        print(f'Serving {folder} on {stub.base_url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
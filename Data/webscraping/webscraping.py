@@ -4,10 +4,17 @@ worldwide media usage. These data will be used for the experiments of
 sub-question 3 and 4.
 '''
 
-from bs4 import BeautifulSoup
+import argparse
+from checkpoint import Checkpoint, CHECKPOINT_FILE, checkpoint_file
 import csv
-import requests
-import re
+from extractor import extract_metrics, make_soup, PARSER, YEAR
+from fetch_policy import CircuitBreaker, FetchPolicy
+from fetching import default_policy, fetch, fetch_all, MAX_WORKERS
+from functools import partial
+from instrumentation import extractor, instruments, procedure
+from page_cache import PageCache
+from panel import missing_years, write_partition
+from websites import country_urls, parse_years
 from websites_2021 import country_urls2021
 
 from pathlib import Path
@@ -15,67 +22,98 @@ BASE_DIR = Path(__file__).resolve().parents[2]
 
 amount_str = ['hundred', 'thousand', 'million']
 
-MULTIPLIERS = {
-    'thousand': 10 ** 3,
-    'million': 10 ** 6,
-    'billion': 10 ** 9
-}
+# All procedures share one on-disk page cache (see page_cache.py), so every
+# page is downloaded once. Set page_cache.offline = True to only use pages
+# that are already cached (e.g. after fixing a parser).
+page_cache = PageCache()
 
 
 '''
     Section 1: Extracting data using webscraping.
 '''
 
-''' Subsection 1.1: Global function for extracting soup. '''
-def get_soup(url):
-    try:
-        html = requests.get(url).text
-        soup = BeautifulSoup(html, "html.parser")
-        return soup
-    except:
+''' Subsection 1.1: Global functions for extracting soup. '''
+def timed_fetch(url, cache=page_cache, policy=default_policy):
+    ''' fetch() that records its time (see instrumentation.py). '''
+    with instruments.timer('fetch'):
+        return fetch(url, cache, policy)
+
+
+def parse(html, parser=PARSER):
+    with instruments.timer('parse'):
+        return make_soup(html, parser)
+
+
+def get_soup(url, cache=page_cache, parser=PARSER):
+    html = timed_fetch(url, cache)
+
+    if html is None:
         # print('Invalid URL')  # For debugging
+        instruments.count('fetch.failed')
         return None
 
-'''
-Subsection 1.1: Extracting and computing exact values (e.g., 48.000, 1248.)
-'''
+    return parse(html, parser)
 
-def extract_population(soup):
-    '''Extracts a country's population given a soup.
+
+def get_soups(country_urls: dict, workers=MAX_WORKERS, cache=page_cache,
+              parser=PARSER, policy=default_policy):
+    '''Yields (country, soup) for all countries, in the order of country_urls.
+
+    The pages are downloaded concurrently by at most `workers` threads (see
+    fetching.py), soup is None for pages that could not be fetched. Pages
+    in the cache are not downloaded again (cache=None disables it). The
+    parser can be 'html.parser' or the faster 'lxml'. The policy sets the
+    timeouts, rate limit and retries (see fetch_policy.py).
     '''
+    pages = fetch_all(country_urls.values(), workers,
+                      partial(timed_fetch, cache=cache, policy=policy))
 
-    if not soup:
-        print('Invalid soup')
-        return None
+    for country, html in zip(country_urls, pages):
+        if html is None:
+            instruments.count('fetch.failed')
+            yield country, None
+        else:
+            yield country, parse(html, parser)
 
-    for bold in soup.find_all('b'):
-        bold_text = bold.get_text(" ").lower().strip()
+'''
+Subsection 1.1: Extracting and computing exact values (e.g., 48.000, 1248.)
+'''
 
-        # Skip bolds with no digits
-        if not any(c.isdigit() for c in bold_text):
-            continue
+# All extract functions below are wrappers around extract_metrics (see
+# extractor.py), which finds all metrics of a page in one walk over the page.
+# @extractor records their time and missing values (see instrumentation.py).
 
-        sentence = bold.parent.get_text(" ").lower()
+# The metrics of the last page, so asking several metrics of one page walks
+# it only once. Soups are compared by identity: hashing one serializes it.
+last_metrics = (None, None)
 
-        number = 0.0
-        if 'population'not in sentence:
-            continue
 
-        splitted_text = bold_text.split()
+def page_metrics(soup):
+    '''Returns extract_metrics(soup), walking the page only once for calls
+    on the same soup in a row.
+    '''
+    global last_metrics
 
-        number = float(splitted_text[0].replace(',', '.'))
+    last_soup, metrics = last_metrics
+    if last_soup is not soup:
+        metrics = extract_metrics(soup)
+        last_metrics = (soup, metrics)
+    return metrics
 
-        if len(splitted_text) > 1 and splitted_text[1] in MULTIPLIERS:
 
-            number *= MULTIPLIERS[splitted_text[1]]
-        else:
-            number *= 1000  # value is smaller than 10000
+@extractor
+def extract_population(soup):
+    '''Extracts a country's population given a soup.
+    '''
 
-        return int(number)
+    if not soup:
+        print('Invalid soup')
+        return None
 
-    return None
+    return page_metrics(soup).population
 
 
+@extractor
 def extract_number_social_media_users(soup):
     '''
     Extracts number of social media users given a soup.
@@ -85,29 +123,7 @@ def extract_number_social_media_users(soup):
         print('Invalid soup')
         return None
 
-    for bold in soup.find_all("b"):
-        bold_text = bold.get_text(" ").lower().strip()
-
-        # Skip bolds with no digits
-        if not any(c.isdigit() for c in bold_text):
-            continue
-
-        sibling = bold.next_sibling
-
-        if not sibling or 'social media users' not in bold.next_sibling:
-            continue
-
-        splitted_text = bold_text.split()  # first value is integer
-        number = float(splitted_text[0].replace(',', '.'))
-
-        if len(splitted_text) > 1 and splitted_text[1] in MULTIPLIERS:
-            number *= MULTIPLIERS[splitted_text[1]]
-        else:
-            number *= 1000  # value is smaller than 10000
-
-        return int(number)
-
-    return None
+    return page_metrics(soup).social_media_users
 
 
 # def get_emperical_ratios(country_urls):
@@ -149,8 +165,10 @@ def extract_number_social_media_users(soup):
 1.2: Extracting percentages using webscraping (Sub-questions 3 and 4).
 '''
 
+@extractor
 def get_ratio_population(soup):
-    ''' Returns the number of
+    ''' Returns the growth of the population between January 2020 and
+    January 2021.
 
     Args:
         soup: webpage file in which we need to find ratio.
@@ -164,29 +182,10 @@ def get_ratio_population(soup):
         print('Invalid soup')
         return None
 
-    for bold in soup.find_all("b"):
-
-        sentence = bold.parent.get_text(" ").lower()
-
-        about_population = 'population' in sentence
-        in_time_period = 'between january 2020 and january 2021' in sentence
-
-        if not about_population or not in_time_period:
-            continue
-
-        if 'unchanged' in sentence:
-            return 0.0
-
-        match = re.search(r'\(([-+]?[\d\.]+)%\)', sentence)
-        # print(match)
-
-        if match:
-            percentage = float(match.group(1))
-            return percentage
-
-    return None
+    return page_metrics(soup).population_growth
 
 
+@extractor
 def get_ratio_users(soup):
     '''Returns the percentage of media users a country
     increased/decreased in 2020-2021.
@@ -196,90 +195,135 @@ def get_ratio_users(soup):
         print('Invalid soup')
         return None
 
-    for bold in soup.find_all("b"):
-
-        sentence = bold.parent.get_text(" ").lower()
+    return page_metrics(soup).users_growth
 
-        about_population = 'social media users' in sentence
-        in_time_period = 'between 2020 and 2021' in sentence # or 'in january 2021' in sentence  # Check this for christmas island
 
-        if not about_population or not in_time_period:
-            continue
-
-        if 'unchanged' in sentence:
-            return 0.0
+@extractor
+def extract_percentage_social_media_users_populaton(soup):
+    ''' Returns the percentage of a population that uses social media.'''
 
-        match = re.search(r'\(([-+]?[\d\.]+)%\)', sentence)
+    if not soup:
+        print('Invalid soup')
+        return None
 
-        if match:
-            percentage = float(match.group(1))
-            return percentage
+    return page_metrics(soup).users_percentage
 
-        match2 = re.search(r'([-+]?[\d\.]+)%', sentence)
 
-        if match2:
-            percentage = float(match2.group(1))
-            return percentage
+@procedure
+def get_ratio_population_vs_users(country_urls: dict, workers=MAX_WORKERS):
+    '''Stores the percentages of population and social media users growth
+        in each country.
 
-    return None
+    Args:
+        country_urls: All countries as keys with their URLs as values.
+        workers: Number of pages that are downloaded at the same time.
 
+    Returns:
+        A dictionary with the countries as the keys and the tuple
+        (population_ratio, social_media_users_ratio) as the values.
+    '''
+    ratios = {}
 
-def extract_percentage_social_media_users_populaton(soup):
-    ''' Returns the percentage of a population that uses social media.'''
+    for country, soup in get_soups(country_urls, workers):
+        if not soup:
+            continue
 
-    if not soup:
-        print('Invalid soup')
-        # return None
+        metrics = extract_metrics(soup)
+        population_ratio = metrics.population_growth
+        users_ratio = metrics.users_growth
 
-    for bold in soup.find_all("b"):
+        if not population_ratio or not users_ratio:
+            continue
 
-        line = bold.parent.get_text(" ").lower()
+        ratios[country] = (population_ratio, users_ratio)
 
-        if 'social media users' not in line or 'total population' not in line:
-            continue
+    return ratios
 
-        match = re.search(r'\(([-+]?[\d\.]+)%\)', line)
 
-        if match:
-            percentage = float(match.group(1))
-            return percentage
+''' Section 3: Resumable crawl with a checkpoint (see checkpoint.py).'''
 
-        match2 = re.search(r'([-+]?[\d\.]+)%', line)
 
-        if match2:
-            percentage = float(match2.group(1))
-            return percentage
+def count_missing(metrics: dict):
+    ''' Counts the pages and the metrics that were not found on them. '''
+    if not instruments.enabled:
+        return
+    for metric, value in metrics.items():
+        instruments.count(f'metric.{metric}.pages')
+        if value is None:
+            instruments.count(f'metric.{metric}.missing')
 
 
-def get_ratio_population_vs_users(country_urls: dict):
-    '''Stores the percentages of population and social media users growth
-        in each country.
+@procedure
+def crawl(country_urls: dict, checkpoint: Checkpoint, retry_failed=False,
+          workers=MAX_WORKERS, cache=page_cache, year=YEAR):
+    '''Fetches and extracts the pages that are not in the checkpoint yet,
+    appending the result of every country to the checkpoint as soon as it
+    is done. An interrupted crawl continues where it stopped.
 
     Args:
         country_urls: All countries as keys with their URLs as values.
+        checkpoint: The Checkpoint of the crawl.
+        retry_failed: Also fetch the countries in the failure ledger again.
+        workers: Number of pages that are downloaded at the same time.
+        cache: The PageCache (None disables it).
+        year: The year of the reports.
 
     Returns:
-        A dictionary with the countries as the keys and the tuple
-        (population_ratio, social_media_users_ratio) as the values.
+        A dictionary with the metrics of every completed country, in the
+        order of country_urls.
     '''
-    ratios = {}
-
-    for country in country_urls.keys():
+    pending = checkpoint.pending(country_urls, retry_failed)
+    print(f'Fetching {len(pending)} of {len(country_urls)} countries')
 
-        url = country_urls[country]
-        soup = get_soup(url)
+    for country, soup in get_soups(pending, workers, cache):
         if not soup:
+            checkpoint.append(country, pending[country],
+                              error='page could not be fetched')
             continue
 
-        population_ratio = get_ratio_population(soup)
-        users_ratio = get_ratio_users(soup)
+        with instruments.timer('extract.extract_metrics'):
+            metrics = extract_metrics(soup, year).as_dict()
+        count_missing(metrics)
 
-        if not population_ratio or not users_ratio:
+        if all(value is None for value in metrics.values()):
+            checkpoint.append(country, pending[country], metrics,
+                              error='no metrics found on the page')
+        else:
+            checkpoint.append(country, pending[country], metrics)
+
+    failed = checkpoint.failed()
+    if failed:
+        print(f'{len(failed)} countries failed: {", ".join(failed)}\n'
+              'Run again with --retry-failed to fetch only these again.')
+
+    return checkpoint.results(country_urls)
+
+
+@procedure
+def crawl_years(years, retry_failed=False, restart=False, workers=MAX_WORKERS,
+                cache=page_cache):
+    '''Crawls the reports of the given years into the year-partitioned panel
+    (see panel.py). Only years without a partition are crawled, every year
+    with its own checkpoint. retry_failed also crawls the failed countries
+    of the given years again, restart crawls the given years from scratch.
+    '''
+    for year in years:
+        checkpoint = Checkpoint(checkpoint_file(year))
+        if restart:
+            checkpoint.restart()
+        elif not missing_years([year]) and not (retry_failed and
+                                                checkpoint.failed()):
             continue
 
-        ratios[country] = (population_ratio, users_ratio)
+        print(f'Crawling the {year} reports')
+        results = crawl(country_urls(year), checkpoint, retry_failed,
+                        workers, cache, year)
+        if not results:
+            # Keep the year missing, so the next run tries it again.
+            continue
 
-    return ratios
+        path = write_partition(year, results)
+        print(f'Stored {len(results)} countries in {path}')
 
 
 ''' Section 4: Saving extracted data for sub-questions 3 and 4.'''
@@ -303,14 +347,16 @@ def store_ratios_and_countries(ratios: dict, file_as_str):
     print('Wrote countries to ratios_countries_social_media.csv successfully')
 
 
+@procedure
 def ratios_procedure():
     country_urls = country_urls2021
     ratios = get_ratio_population_vs_users(country_urls)
     store_ratios_and_countries(ratios, '../ratios_countries_social_media.csv')
 
 
-
-def store_percentage_users_in_countries(country_urls: dict, files_as_str):
+@procedure
+def store_percentage_users_in_countries(country_urls: dict, files_as_str,
+                                        workers=MAX_WORKERS):
     ''' Stores the percentages of all the populations that are social media
     users in a specific year in a CSV-file.
     '''
@@ -318,25 +364,101 @@ def store_percentage_users_in_countries(country_urls: dict, files_as_str):
         writer = csv.writer(file)
         writer.writerow(['Country', 'Social Media Users (%)'])
 
-        for country in country_urls.keys():
-            url = country_urls[country]
-            soup = get_soup(url)
+        for country, soup in get_soups(country_urls, workers):
             percentage = extract_percentage_social_media_users_populaton(soup)
             writer.writerow([country, percentage])
             print(f'Writing ({country}, {percentage}) to file')
 
         print(f'Finished storing data to {files_as_str}')
 
-''' Section 5: Test function'''
-def tests():
-    soup = get_soup('https://datareportal.com/reports/digital-2021-netherlands')
+
+def store_metric_in_csv(country_urls: dict, results: dict, metric, header,
+                        file_as_str):
+    '''Stores one metric of the crawl results of every country in a CSV-file,
+    empty for countries without a result.
+    '''
+    with open(file_as_str, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Country', header])
+
+        for country in country_urls:
+            writer.writerow([country, results.get(country, {}).get(metric)])
+
+    print(f'Finished storing data to {file_as_str}')
+
+
+def store_results(country_urls: dict, results: dict):
+    '''Stores the crawl results in the three CSV-files of sub-questions 3
+    and 4, in the same format as the separate procedures.
+    '''
+    ratios = {country: (metrics['population_growth'], metrics['users_growth'])
+              for country, metrics in results.items()
+              if metrics['population_growth'] and metrics['users_growth']}
+    store_ratios_and_countries(
+        ratios, BASE_DIR / 'Data/ratios_countries_social_media.csv')
+
+    store_metric_in_csv(country_urls, results, 'users_percentage',
+                        'Social Media Users (%)',
+                        BASE_DIR / 'Data/percentages_population_users.csv')
+    store_metric_in_csv(country_urls, results, 'social_media_users',
+                        'Social Media Users (N)',
+                        BASE_DIR / 'Data/social_media_users_2021.csv')
+
+
+''' Section 5: Test functions'''
+@procedure
+def tests(live=False):
+    '''Checks the extractors on the Netherlands, Christmas Island and Albania,
+    and on every other page in the fixture store (see fixtures.py).
+
+    By default the saved pages are served by a local stub server, so no
+    network access is needed. The server answers the first request of every
+    page with a 429 or 503 error, to check the retries of the fetch policy.
+    live=True checks the live pages instead.
+    '''
+    # The test infrastructure is only needed here.
+    import baseline_extractors as baseline
+    from fixtures import (FIXTURES_DIR, load_expected, reconstruct_page,
+                          recorded_countries)
+    from stub_server import Faults, StubServer, local_urls, read_page
+
+    expected = load_expected()
+    urls = {country: entry['url'] for country, entry in expected.items()}
+
+    if live:
+        soups = dict(get_soups(urls, cache=None))
+    else:
+        # No rate limit and short backoffs for the local server.
+        policy = FetchPolicy(rate=None, backoff_base=0.01,
+                             breaker=CircuitBreaker(threshold=len(urls) + 1))
+
+        with StubServer(FIXTURES_DIR, Faults(fail_first=1, seed=0)) as server:
+            soups = dict(get_soups(local_urls(urls, server.base_url),
+                                   cache=None, policy=policy))
+
+        assert all(hits == 2 for hits in server.hits.values())
+
+        # A download that breaks off is retried, also when it is the trial
+        # request of a half-open circuit breaker.
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        policy = FetchPolicy(rate=None, backoff_base=0.01, breaker=breaker)
+
+        with StubServer(FIXTURES_DIR, Faults(truncate_first=2)) as server:
+            url = local_urls(urls, server.base_url)['Netherlands']
+            html = fetch(url, None, policy)
+
+        name = url.rstrip('/').split('/')[-1]
+        assert html == read_page(FIXTURES_DIR, name).decode('utf-8')
+        assert server.hits == {name: 3} and breaker.state == 'closed'
+
+    soup = soups['Netherlands']
     assert extract_population(soup) == 17150000
     assert get_ratio_population(soup) == 0.2
     assert extract_number_social_media_users(soup) == 15100000
     assert get_ratio_users(soup) == 0.0
     assert extract_percentage_social_media_users_populaton(soup) == 88.0
 
-    soup2 = get_soup('https://datareportal.com/reports/digital-2021-christmas-island')
+    soup2 = soups['Christmas Island']
     assert extract_population(soup2) == 1843
     assert get_ratio_population(soup2) == 0.0
     assert extract_number_social_media_users(soup2) == 1200
@@ -344,15 +466,42 @@ def tests():
     assert extract_percentage_social_media_users_populaton(soup2) == 65.1
 
 
-    soup3 = get_soup('https://datareportal.com/reports/digital-2021-albania')
+    soup3 = soups['Albania']
     assert extract_population(soup3) == 2880000
     assert get_ratio_population(soup3) == -0.1
     assert extract_number_social_media_users(soup3) == 1600000
     assert get_ratio_users(soup3) == 14.0
     assert extract_percentage_social_media_users_populaton(soup3) == 55.6
 
-
-def store_changes_in_csv(country_urls, file_as_str):
+    # All other pages, against the stored values and against the first
+    # version of the extractors, which does not depend on the wording of
+    # the reconstructed pages.
+    for country, entry in expected.items():
+        metrics = page_metrics(soups[country])
+        for metric, value in entry['metrics'].items():
+            assert getattr(metrics, metric) == value, (country, metric)
+        for metric, extract in baseline.EXTRACTORS.items():
+            assert extract(soups[country]) == getattr(metrics, metric), \
+                (country, metric)
+
+    # The growth sentences of other years.
+    for year in [2015, 2019, 2025]:
+        page = make_soup(reconstruct_page('Albania', expected['Albania']
+                                          ['metrics'], year))
+        assert extract_metrics(page, year).as_dict() == \
+            expected['Albania']['metrics']
+        assert extract_metrics(page).population_growth is None
+
+    recorded = recorded_countries(expected)
+    print(f'All tests passed on {len(expected)} pages '
+          f'({len(recorded)} recorded)')
+    if not recorded:
+        print('Warning: no recorded live pages in the fixture store, record '
+              'one with: python fixtures.py record Netherlands')
+
+
+@procedure
+def store_changes_in_csv(country_urls, file_as_str, workers=MAX_WORKERS):
     '''
     Stores the changes in population growth and social media users growth in a
     csv file.
@@ -362,24 +511,54 @@ def store_changes_in_csv(country_urls, file_as_str):
         writer = csv.writer(file)
         writer.writerow(['Country', 'Social Media Users (N)'])
 
-        for country, url in country_urls.items():
-            soup = get_soup(url)
+        for country, soup in get_soups(country_urls, workers):
             num_users = extract_number_social_media_users(soup)
             writer.writerow([country, num_users])
 
     print('Wrote countries to ratios_countries_social_media.csv successfully')
 
 if __name__ == "__main__":
-    # tests()  # Comment this out to prove it works
-
-    # Run line below for getting ratios.
-    ratios_procedure()
-
-    # Comment out the line below for running
-    dir_percentage_file = BASE_DIR / "Data/percentages_population_users.csv"
-
-    store_percentage_users_in_countries(country_urls2021, dir_percentage_file)
-
-    # Run line below for getting the exact values of number of social media users
-    store_changes_in_csv(country_urls2021,
-                         BASE_DIR / "Data/social_media_users_2021.csv")
+    parser = argparse.ArgumentParser(
+        description='Scrapes the datareportal reports of all countries.')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='only fetch the missing and failed countries')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore the checkpoint and crawl everything')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE,
+                        help='checkpoint file of the crawl')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help='number of concurrent downloads')
+    parser.add_argument('--offline', action='store_true',
+                        help='only use pages from the page cache')
+    parser.add_argument('--years',
+                        help='crawl the reports of these years into the '
+                             'panel, like 2015-2025 (only missing years)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='print a JSON summary of the timings and '
+                             'failures at the end (see instrumentation.py)')
+    parser.add_argument('--tests', action='store_true',
+                        help='run the tests on the saved pages and stop')
+    args = parser.parse_args()
+    instruments.enabled = args.instrument
+
+    if args.tests:
+        tests()
+        raise SystemExit
+
+    page_cache.offline = args.offline
+
+    if args.years:
+        crawl_years(parse_years(args.years), args.retry_failed, args.restart,
+                    args.workers)
+        raise SystemExit
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.restart()
+
+    # One crawl gives the results of all three former procedures
+    # (ratios_procedure, store_percentage_users_in_countries and
+    # store_changes_in_csv), which are still available separately.
+    results = crawl(country_urls2021, checkpoint, args.retry_failed,
+                    args.workers)
+    store_results(country_urls2021, results)
@@ -0,0 +1,48 @@
+'''
+This file generates the URLs of the datareportal reports of any year. The
+country slugs (like 'netherlands' in .../digital-2021-netherlands) are taken
+from the URLs of the 2021 reports in websites_2021.py.
+'''
+
+from websites_2021 import country_urls2021
+
+REPORT_URL = 'https://datareportal.com/reports/digital-{year}-{slug}'
+SLUG_YEAR = 2021  # the year of the URLs the slugs are taken from
+
+
+def url_slug(url, year=SLUG_YEAR):
+    ''' Returns the country slug of a report URL of the given year. '''
+    return url.rstrip('/').split('/')[-1].removeprefix(f'digital-{year}-')
+
+
+COUNTRY_SLUGS = {country: url_slug(url)
+                 for country, url in country_urls2021.items()}
+
+
+def report_url(slug, year):
+    return REPORT_URL.format(year=year, slug=slug)
+
+
+def country_urls(year, countries=None):
+    '''
+    Returns a dictionary with the countries as keys and the URLs of their
+    reports of the given year as values.
+
+    Args:
+        year: the year of the reports.
+        countries: the countries to include, all countries by default.
+    '''
+    countries = COUNTRY_SLUGS if countries is None else countries
+    return {country: report_url(COUNTRY_SLUGS[country], year)
+            for country in countries}
+
+
+def parse_years(text):
+    ''' Converts a text like '2015-2025' or '2019,2021' to a list of years. '''
+    years = []
+
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        years.extend(range(int(first), int(last or first) + 1))
+
+    return sorted(set(years))
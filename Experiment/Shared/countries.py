@@ -0,0 +1,164 @@
+'''
+This file resolves the country names of the datasets to ISO codes and
+continents, in one place for all sub-questions.
+
+The names are spelled differently in every dataset ('Republic of Korea' in
+the IHME files, 'Bosnia & Herzegovina' and some typos in the scraped
+files), so the names that pycountry_convert does not know are first looked
+up in an alias table. Every name is resolved once (memoized), and whole
+columns are mapped through their unique values:
+
+    data['Continent'] = continents(data['location'])
+
+returns a categorical column, so tagging a frame with millions of rows
+costs one lookup per unique name and one vectorized take of the codes.
+'''
+
+from collections import namedtuple
+from functools import lru_cache
+
+import pandas as pd
+import pycountry_convert as pc
+
+UNKNOWN = 'Unknown'
+
+# Names that pycountry_convert does not resolve, with their alpha-2 code.
+ALIASES = {
+    # IHME GBD names
+    'Bolivia (Plurinational State of)': 'BO',
+    'Iran (Islamic Republic of)': 'IR',
+    'Micronesia (Federated States of)': 'FM',
+    'Republic of Korea': 'KR',
+    'Timor-Leste': 'TL',
+    'Venezuela (Bolivarian Republic of)': 'VE',
+
+    # names of the datareportal reports (see Data/webscraping)
+    'Aland Islands': 'AX',
+    'Anguillia': 'AI',
+    'Antigua & Barbuda': 'AG',
+    'Azerbajian': 'AZ',
+    'Bonaire, ST. Eaustatius & Saba': 'BQ',
+    'Bosnia & Herzegovina': 'BA',
+    'Central African Public': 'CF',
+    'Cocos (Keeling) Island': 'CC',
+    'Cote Divoire': 'CI',
+    'Curacao': 'CW',
+    'Democratic Republic of Congo': 'CD',
+    'Domican Republic': 'DO',
+    'Guinea-bissau': 'GW',
+    'Kosovo': 'XK',
+    'Krygyzstan': 'KG',
+    'Marshall islands': 'MH',
+    'Norfolk Is.': 'NF',
+    'Northern Mariana Is.': 'MP',
+    'Pitcairn Islands': 'PN',
+    'Republic of Congo': 'CG',
+    'Reunion': 'RE',
+    'Sao Tome & Principe': 'ST',
+    'St. Barthelemy': 'BL',
+    'St. Helena': 'SH',
+    'St. Kitts & Nevis': 'KN',
+    'St. Maarten': 'SX',
+    'St. Pierre & Miquelon': 'PM',
+    'St. Vincent & The Grenadines': 'VC',
+    'Svalbard & Jan Mayen': 'SJ',
+    'Swizterland': 'CH',
+    'Timore-Leste': 'TL',
+    'Trinidad & Tobago': 'TT',
+    'Turks & Caicos Islands': 'TC',
+    'U.A.E.': 'AE',
+    'U.S. Virgin Is.': 'VI',
+    'United Kingdom.': 'GB',
+    'Vatican': 'VA',
+    'Wallis & Futuna': 'WF',
+    'Western Sahara': 'EH',
+}
+
+# Regions without an ISO code, with their continent.
+REGIONS = {
+    'Abkhazia': 'Asia',
+    'Transnistria': 'Europe',
+}
+
+# Codes that pycountry_convert has no continent or alpha-3 code for.
+CONTINENT_CODES = {'EH': 'AF', 'PN': 'OC', 'SX': 'NA', 'TL': 'AS', 'VA': 'EU'}
+ALPHA3_CODES = {'XK': 'XKX'}
+
+Country = namedtuple('Country', ['name', 'alpha2', 'alpha3', 'continent'])
+
+ALPHA3 = pc.map_country_alpha2_to_country_alpha3()
+
+
+@lru_cache(maxsize=None)
+def resolve(name):
+    '''
+    Returns the Country (name, alpha-2 and alpha-3 code, continent) of a
+    country name. Unknown names get None codes and the continent 'Unknown'.
+    '''
+    if not isinstance(name, str):  # missing values
+        return Country(name, None, None, UNKNOWN)
+
+    name = name.strip()
+    if name in REGIONS:
+        return Country(name, None, None, REGIONS[name])
+
+    alpha2 = ALIASES.get(name)
+    if alpha2 is None:
+        try:
+            alpha2 = pc.country_name_to_country_alpha2(name)
+        except KeyError:
+            return Country(name, None, None, UNKNOWN)
+
+    try:
+        continent_code = pc.country_alpha2_to_continent_code(alpha2)
+    except KeyError:
+        continent_code = CONTINENT_CODES.get(alpha2)
+
+    continent = UNKNOWN
+    if continent_code is not None:
+        continent = pc.convert_continent_code_to_continent_name(
+            continent_code)
+
+    alpha3 = ALPHA3.get(alpha2, ALPHA3_CODES.get(alpha2))
+    return Country(name, alpha2, alpha3, continent)
+
+
+def country_to_continent(country_name):
+    ''' Returns the continent of a country name, or 'Unknown'. '''
+    return resolve(country_name).continent
+
+
+def map_column(values, field):
+    '''
+    Maps a column of country names to a field of their Country, resolving
+    every unique name once.
+
+    Returns:
+        A pd.Categorical with the field of every value (missing where the
+        field is None, like the codes of unknown names).
+    '''
+    values = pd.Series(values)
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        uniques = values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+
+    # the last entry is for the missing names (code -1)
+    mapped = [getattr(resolve(name), field) for name in uniques]
+    mapped.append(getattr(resolve(None), field))
+
+    lookup, categories = pd.factorize(pd.Series(mapped, dtype=object),
+                                      sort=True)
+    return pd.Categorical.from_codes(lookup[codes], categories.astype(str))
+
+
+def continents(values):
+    ''' Returns the continent of every country name (categorical). '''
+    return map_column(values, 'continent')
+
+
+def iso3_codes(values):
+    ''' Returns the ISO alpha-3 code of every country name (categorical). '''
+    return map_column(values, 'alpha3')
@@ -0,0 +1,221 @@
+'''
+This file builds one country x year panel of all country datasets in Data/,
+keyed by ISO alpha-3 code instead of the free-text country names.
+
+Every source is resolved to ISO codes with Shared/countries.py (so the
+spellings like 'Azerbajian' or 'Republic of Korea' all find their country),
+and all metrics become columns of one table:
+
+    iso3, year, country, continent, <metric columns>
+
+The panel is stored as memory-mappable columns (see datasets.write_columns)
+in Data/.cache/country_panel, and rebuilt automatically when a source file
+changes. An analysis only loads the columns it needs:
+
+    panel = load_panel(['population', 'social_media_users'], year=2021)
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from countries import continents, iso3_codes
+from datasets import (CACHE_DIR, load_column, read_csv_cached, read_manifest,
+                      write_columns)
+from gbd import aggregate_gbd, load_gbd
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+PANEL_DIR = CACHE_DIR / 'country_panel'
+KEYS = ['iso3', 'year', 'country', 'continent']
+YEAR = 2021  # the year of the sources without a year column
+
+DATA = BASE_DIR / 'Data'
+SCRAPED_PANEL_DIR = DATA / 'panel'  # see Data/webscraping/panel.py
+
+
+def ihme_rates():
+    ''' Mental disorder DALYs (rate) per location and year. '''
+    totals = aggregate_gbd(DATA / 'IHME_original_file.csv',
+                           ['location', 'year'])
+    return pd.DataFrame({'name': totals.index.get_level_values('location'),
+                         'year': totals.index.get_level_values('year'),
+                         'mental_dalys_rate': totals['sum'].to_numpy()})
+
+
+def gbd_population():
+    ''' Population numbers of the GBD export. '''
+    data = load_gbd(DATA / 'IHME-GBD_2023_DATA-aeeaa03f-1.csv',
+                    usecols=['location', 'year', 'val'],
+                    filters={'measure': 'Population', 'metric': 'Number'})
+    return pd.DataFrame({'name': data['location'].astype(str),
+                         'year': data['year'], 'population': data['val']})
+
+
+def csv_source(file, columns, name_column='Country', year=YEAR):
+    '''
+    Returns a source that reads the given columns of a CSV in Data/, with
+    the new column names as values of the columns dictionary.
+    '''
+    def read():
+        data = read_csv_cached(DATA / file,
+                               usecols=[name_column, *columns])
+        data = data.rename(columns={name_column: 'name', **columns})
+        data['year'] = year
+        return data
+
+    read.__doc__ = f''' The columns of {file}. '''
+    return read
+
+
+def scraped_panel():
+    ''' The years scraped into Data/panel (see Data/webscraping). '''
+    paths = sorted(SCRAPED_PANEL_DIR.glob('year=*.csv'))
+    if not paths:
+        return pd.DataFrame(columns=['name', 'year'])
+
+    data = pd.concat([pd.read_csv(path) for path in paths],
+                     ignore_index=True)
+    return data.rename(columns={
+        'Country': 'name', 'Year': 'year',
+        'Population (N)': 'reported_population',
+        'Social Media Users (N)': 'social_media_users',
+        'Population Growth (%)': 'population_growth',
+        'Social Media Users Growth (%)': 'social_media_users_growth',
+        'Social Media Users (%)': 'social_media_users_pct'})
+
+
+# The sources of the panel. Where two sources have a value for the same
+# country, year and column, the first source wins.
+SOURCES = {
+    'ihme': (ihme_rates, ['IHME_original_file.csv']),
+    'gbd_population': (gbd_population,
+                       ['IHME-GBD_2023_DATA-aeeaa03f-1.csv']),
+    'mental_health_change_rate': (
+        csv_source('mental_health_change_rate.csv',
+                   {'change_rate': 'mental_change_rate'}, 'location'),
+        ['mental_health_change_rate.csv']),
+    'merged_final': (
+        csv_source('merged_final.csv',
+                   {'MentalHealthPercent': 'mental_health_percent'}),
+        ['merged_final.csv']),
+    'social_media_users': (
+        csv_source('social_media_users_2021.csv',
+                   {'Social Media Users (N)': 'social_media_users'}),
+        ['social_media_users_2021.csv']),
+    'percentages': (
+        csv_source('percentages_population_users.csv',
+                   {'Social Media Users (%)': 'social_media_users_pct'}),
+        ['percentages_population_users.csv']),
+    'ratios': (
+        csv_source('ratios_countries_social_media.csv',
+                   {'Population Growth (%)': 'population_growth',
+                    'Social Media Users Growth (%)':
+                        'social_media_users_growth'}),
+        ['ratios_countries_social_media.csv']),
+    'scraped': (scraped_panel, []),
+}
+
+
+def source_files():
+    ''' Returns the size and modification time of every source file. '''
+    files = [DATA / file for _, files in SOURCES.values() for file in files]
+    files += sorted(SCRAPED_PANEL_DIR.glob('year=*.csv'))
+
+    signature = {}
+    for path in files:
+        stat = os.stat(path)
+        signature[str(path.relative_to(DATA))] = [stat.st_size,
+                                                  stat.st_mtime_ns]
+    return signature
+
+
+def build_panel(folder=PANEL_DIR, verbose=False):
+    '''
+    Builds the panel from all sources and stores it in folder. verbose
+    prints the names that could not be matched to an ISO code.
+
+    Returns:
+        The panel as a DataFrame, sorted by iso3 and year.
+    '''
+    frames = []
+    for priority, (source, _) in enumerate(SOURCES.values()):
+        data = source()
+        long = data.melt(id_vars=['name', 'year'], var_name='column',
+                         value_name='value')
+        long['priority'] = priority
+        frames.append(long)
+
+    long = pd.concat(frames, ignore_index=True)
+    long = long[long['value'].notna()]
+    long['iso3'] = np.asarray(iso3_codes(long['name']), dtype=object)
+
+    unresolved = sorted(set(long.loc[long['iso3'].isna(), 'name']))
+    if unresolved and verbose:
+        print(f'Names without an ISO code (left out): {unresolved}')
+    long = long[long['iso3'].notna()]
+
+    # the first source wins, then the first name
+    long = long.sort_values('priority', kind='stable')
+    names = long.drop_duplicates('iso3').set_index('iso3')['name']
+    long = long.drop_duplicates(['iso3', 'year', 'column'])
+
+    panel = long.pivot(index=['iso3', 'year'], columns='column',
+                       values='value')
+    panel = panel.reset_index()
+    panel.columns.name = None
+
+    # metric columns in the order of the sources
+    metrics = list(dict.fromkeys(long.sort_values('priority')['column']))
+    panel = panel[['iso3', 'year'] + metrics]
+    panel[metrics] = panel[metrics].astype(np.float64)
+    panel['year'] = panel['year'].astype(np.int16)
+    panel.insert(2, 'country', panel['iso3'].map(names))
+    panel.insert(3, 'continent', continents(panel['country']))
+
+    for column in ['iso3', 'country']:
+        panel[column] = panel[column].astype('category')
+
+    write_columns(panel, folder, sources=source_files())
+    return panel
+
+
+def load_panel(columns=None, year=None, folder=PANEL_DIR):
+    '''
+    Returns the panel with the key columns (iso3, year, country, continent)
+    and the given metric columns (default all), (re)building it when a
+    source changed. The numeric columns are memory-mapped.
+
+    Args:
+    - columns: names of the metric columns to load.
+    - year: only return the rows of this year.
+    '''
+    folder = Path(folder)
+    manifest = read_manifest(folder)
+    if manifest is None or manifest.get('sources') != source_files():
+        build_panel(folder)
+        manifest = read_manifest(folder)
+
+    names = [column['name'] for column in manifest['columns']]
+    wanted = names if columns is None else KEYS + list(columns)
+    missing = set(wanted).difference(names)
+    if missing:
+        raise ValueError(f"Columns not in the panel: {sorted(missing)}")
+
+    panel = pd.DataFrame({
+        column['name']: load_column(folder, i, column, categorical=True)
+        for i, column in enumerate(manifest['columns'])
+        if column['name'] in wanted}, copy=False)
+
+    if year is not None:
+        panel = panel[panel['year'] == year].reset_index(drop=True)
+    return panel
+
+
+if __name__ == "__main__":
+    panel = build_panel(verbose=True)
+    print(f'Stored {len(panel)} rows and {panel.shape[1]} columns in '
+          f'{PANEL_DIR}')
+    print(panel.describe().T)
@@ -0,0 +1,238 @@
+'''
+This file implements a columnar on-disk cache for the CSV files in Data/.
+
+On first use a CSV is converted to one .npy file per column, stored in
+Data/.cache/<file name>/. Numeric columns are memory-mapped on later runs,
+text columns are stored as integer codes plus their (unique) categories, so
+no text has to be parsed again. A manifest stores the size, modification
+time and hash of the CSV, the cache is rebuilt as soon as the file changes.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+CACHE_DIR = BASE_DIR / 'Data/.cache'
+MANIFEST = 'manifest.json'
+VERSION = 1  # increase when the cache format changes
+READ_ATTEMPTS = 3  # reads of a cache that is swapped meanwhile
+
+
+def file_hash(path):
+    ''' Returns the sha1 hash of a file, read in blocks of 1 MB. '''
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2 ** 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def cache_folder(path, cache_dir=CACHE_DIR):
+    ''' Returns the cache folder of a CSV file. '''
+    path = Path(path).resolve()
+    try:
+        name = str(path.relative_to(BASE_DIR / 'Data'))
+    except ValueError:
+        name = hashlib.sha1(str(path).encode()).hexdigest()[:12] + path.name
+    return Path(cache_dir) / name.replace(os.sep, '__')
+
+
+def read_manifest(folder):
+    ''' Returns the manifest of a cache folder, or None if it is missing. '''
+    try:
+        with open(folder / MANIFEST) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == VERSION else None
+
+
+def write_manifest(folder, manifest):
+    ''' Writes the manifest of a cache folder. '''
+    with open(folder / MANIFEST, 'w') as file:
+        json.dump(manifest, file, indent=1)
+
+
+def is_valid(manifest, path):
+    '''
+    Checks if the cache still matches the CSV. The hash is only computed if
+    the size or modification time changed, and a matching hash refreshes the
+    stored modification time.
+    '''
+    stat = os.stat(path)
+    if manifest is None or manifest['size'] != stat.st_size:
+        return False
+    if manifest['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if manifest['sha1'] != file_hash(path):
+        return False
+
+    manifest['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+
+def write_columns(df, folder, **info):
+    '''
+    Stores a DataFrame as one .npy file per column in folder, with a
+    manifest that also holds the extra info. The folder is built under a
+    unique temporary name and swapped in at the end, so a crash never
+    leaves a broken cache and processes that build the same cache at the
+    same time do not write into each other's files. Returns the manifest.
+    '''
+    folder = Path(folder)
+    folder.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=folder.name + '.', suffix='.tmp',
+                                dir=folder.parent))
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        column = {'name': name, 'dtype': str(series.dtype)}
+
+        if series.dtype.kind in 'biuf':
+            column['kind'] = 'numeric'
+            np.save(tmp / f'{i}.npy', series.to_numpy())
+        else:
+            column['kind'] = 'text'
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy()
+                categories = series.cat.categories
+                column['dtype'] = str(categories.dtype)
+            else:
+                codes, categories = pd.factorize(series)
+            np.save(tmp / f'{i}.codes.npy', codes.astype(np.int32))
+            np.save(tmp / f'{i}.categories.npy',
+                    np.asarray(categories, dtype=str))
+        columns.append(column)
+
+    manifest = {'version': VERSION, **info, 'rows': len(df),
+                'columns': columns}
+    write_manifest(tmp, manifest)
+    swap_folder(tmp, folder, manifest)
+    return manifest
+
+
+def swap_folder(tmp, folder, manifest):
+    '''
+    Moves the built folder tmp to folder. An identical build that another
+    process swapped in meanwhile is kept, so concurrent builds of the same
+    source swap only once. Otherwise the existing folder is first moved
+    aside, so readers see either the old or the new cache.
+    '''
+    if read_manifest(folder) == manifest:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    try:
+        os.replace(tmp, folder)  # fails if folder exists and is not empty
+        return
+    except OSError:
+        pass
+
+    old = Path(tempfile.mkdtemp(prefix=folder.name + '.', suffix='.old',
+                                dir=folder.parent))
+    try:
+        os.replace(folder, old)
+    except OSError:
+        pass  # moved aside by another process
+
+    try:
+        os.replace(tmp, folder)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def build_cache(path, folder):
+    ''' Converts a CSV file to one .npy file per column. '''
+    stat = os.stat(path)
+    sha1 = file_hash(path)
+    df = pd.read_csv(path)
+
+    return write_columns(df, folder, source=str(path), size=stat.st_size,
+                         mtime_ns=stat.st_mtime_ns, sha1=sha1)
+
+
+def load_manifest(path, cache_dir=CACHE_DIR):
+    ''' Returns the manifest and folder of a valid cache, (re)building it. '''
+    folder = cache_folder(path, cache_dir)
+    manifest = read_manifest(folder)
+    mtime_ns = manifest and manifest['mtime_ns']
+
+    if not is_valid(manifest, path):
+        return build_cache(path, folder), folder
+
+    # The file was touched but not changed: store the new modification time,
+    # so the hash is not computed again on the next run.
+    if manifest['mtime_ns'] != mtime_ns:
+        write_manifest(folder, manifest)
+    return manifest, folder
+
+
+def load_column(folder, i, column, categorical=False):
+    ''' Loads one cached column, numeric columns are memory-mapped. '''
+    if column['kind'] == 'numeric':
+        # Copy-on-write mapping: the values can be changed in memory, but
+        # the changes are never written back to the cache. The plain
+        # ndarray view keeps the mapping open without the np.memmap class.
+        return np.load(folder / f'{i}.npy', mmap_mode='c').view(np.ndarray)
+
+    codes = np.load(folder / f'{i}.codes.npy')
+    categories = np.load(folder / f'{i}.categories.npy')
+
+    if categorical:
+        return pd.Categorical.from_codes(codes, categories)
+
+    values = categories.astype(object)[codes]
+    values[codes < 0] = np.nan
+    return pd.array(values, dtype=column['dtype'])
+
+
+def read_columns(path, usecols=None, categorical=False, cache_dir=CACHE_DIR):
+    '''
+    Returns the columns of a CSV file as a dictionary of arrays, read from
+    the cache.
+
+    Args:
+    - path: path of the CSV file.
+    - usecols: names of the columns to load (default all), in file order.
+    - categorical: return text columns as pd.Categorical instead of strings.
+    - cache_dir: folder of the cache.
+    '''
+    for attempt in range(READ_ATTEMPTS):
+        manifest, folder = load_manifest(path, cache_dir)
+        names = [column['name'] for column in manifest['columns']]
+
+        if usecols is not None:
+            missing = set(usecols).difference(names)
+            if missing:
+                raise ValueError(f"Columns not in {path}: {sorted(missing)}")
+
+        try:
+            return {column['name']: load_column(folder, i, column,
+                                                categorical)
+                    for i, column in enumerate(manifest['columns'])
+                    if usecols is None or column['name'] in usecols}
+        except FileNotFoundError:
+            # Another process swapped in a new build while reading.
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+
+
+def read_csv_cached(path, usecols=None, categorical=False,
+                    cache_dir=CACHE_DIR):
+    '''
+    Drop-in replacement for pd.read_csv(path, usecols=usecols) that reads
+    from the columnar cache (see read_columns). The numeric columns of the
+    DataFrame are the memory-mapped arrays themselves, not copies.
+    '''
+    return pd.DataFrame(read_columns(path, usecols, categorical, cache_dir),
+                        copy=False)
@@ -0,0 +1,190 @@
+'''
+This file implements a streaming reader for IHME GBD exports, which can be
+too large to read at once.
+
+The file is read in chunks of CHUNK_ROWS rows, with:
+ - projection: only the needed columns are parsed (usecols);
+ - explicit dtypes: the dimensions (measure, location, sex, age, cause,
+   metric) as categoricals, the ids and the year as small integers and the
+   values as floats;
+ - filter pushdown: every chunk is filtered (e.g. on year, measure and
+   metric) before anything is kept;
+ - incremental aggregates: aggregate_gbd() folds every chunk into running
+   sums, counts, minima and maxima per group.
+So the peak memory depends on the chunk size and on the result, not on the
+size of the file.
+
+The columns of the GBD results tool (measure_name, location_name, ...) and
+of the short export (measure, location, ...) are both renamed to the short
+names, so the same code reads both.
+'''
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+CHUNK_ROWS = 250_000
+
+DIMENSIONS = ('measure', 'location', 'sex', 'age', 'cause', 'metric')
+VALUES = ('val', 'upper', 'lower')
+
+AGGREGATES = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+def normalized_name(column):
+    ''' Returns the short name of a column, like 'location' for
+    'location_name'. '''
+    if column.endswith('_name') and column[:-len('_name')] in DIMENSIONS:
+        return column[:-len('_name')]
+    return column
+
+
+def column_dtype(name):
+    ''' Returns the dtype of a (short) column name. '''
+    if name in DIMENSIONS:
+        return 'category'
+    if name == 'year':
+        return np.int16
+    if name.endswith('_id'):
+        return np.int32
+    if name in VALUES:
+        return np.float64
+    return None
+
+
+def gbd_columns(path):
+    ''' Returns a dictionary with the short name of every column in the file
+    as keys and the name in the file as values. '''
+    header = pd.read_csv(path, nrows=0).columns
+    return {normalized_name(column): column for column in header}
+
+
+def as_list(values):
+    ''' Returns a single value (like a string) as a list of one value. '''
+    if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+        return [values]
+    return list(values)
+
+
+def read_gbd_chunks(path, usecols=None, filters=None, chunksize=CHUNK_ROWS):
+    '''
+    Yields the rows of a GBD export in chunks (DataFrames).
+
+    Args:
+    - path: path of the CSV file.
+    - usecols: short names of the columns to return (default all).
+    - filters: dictionary with a short column name as key and the allowed
+      value, or a list of allowed values, as value. Rows that do not match
+      are dropped while reading.
+    - chunksize: number of rows that are parsed at once.
+    '''
+    columns = gbd_columns(path)
+    filters = {name: as_list(values)
+               for name, values in (filters or {}).items()}
+
+    usecols = list(columns) if usecols is None else list(usecols)
+    missing = set(usecols).union(filters).difference(columns)
+    if missing:
+        raise ValueError(f"Columns not in {path}: {sorted(missing)}")
+
+    read = usecols + [name for name in filters if name not in usecols]
+    dtypes = {columns[name]: column_dtype(name) for name in read
+              if column_dtype(name) is not None}
+    renames = {columns[name]: name for name in read}
+
+    reader = pd.read_csv(path, usecols=[columns[name] for name in read],
+                         dtype=dtypes, chunksize=chunksize)
+
+    with reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=renames)
+
+            if filters:
+                mask = np.ones(len(chunk), dtype=bool)
+                for name, values in filters.items():
+                    mask &= chunk[name].isin(values).to_numpy()
+                chunk = chunk[mask]
+
+            yield chunk[usecols]
+
+
+def concat_chunks(chunks, columns=None):
+    '''
+    Concatenates chunks, keeping the categoricals categorical (pd.concat
+    turns categoricals with different categories into objects).
+    '''
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+
+    data = {}
+    for name in chunks[0].columns:
+        parts = [chunk[name] for chunk in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            data[name] = union_categoricals(parts)
+        else:
+            data[name] = np.concatenate([part.to_numpy() for part in parts])
+    return pd.DataFrame(data)
+
+
+def load_gbd(path, usecols=None, filters=None, chunksize=CHUNK_ROWS):
+    '''
+    Returns the rows of a GBD export that pass the filters as one DataFrame,
+    read in chunks (see read_gbd_chunks). Only the filtered rows are ever
+    kept in memory.
+    '''
+    return concat_chunks(read_gbd_chunks(path, usecols, filters, chunksize),
+                         usecols)
+
+
+def plain_index(frame):
+    ''' Replaces categorical index levels by plain values, so the partial
+    aggregates of chunks with different categories can be combined. '''
+    if isinstance(frame.index, pd.MultiIndex):
+        frame.index = pd.MultiIndex.from_arrays(
+            [level.astype(object) if isinstance(level, pd.CategoricalIndex)
+             else level
+             for level in (frame.index.get_level_values(i)
+                           for i in range(frame.index.nlevels))],
+            names=frame.index.names)
+    elif isinstance(frame.index, pd.CategoricalIndex):
+        frame.index = frame.index.astype(object)
+    return frame
+
+
+def aggregate_gbd(path, by, value='val', filters=None, chunksize=CHUNK_ROWS):
+    '''
+    Aggregates a value of a GBD export per group, in one streaming pass.
+
+    Args:
+    - path: path of the CSV file.
+    - by: short name(s) of the columns to group by.
+    - value: the column to aggregate.
+    - filters: see read_gbd_chunks.
+
+    Returns:
+        A DataFrame indexed by the groups (sorted) with the columns sum,
+        count (of the non-missing values), min, max and mean.
+    '''
+    by = as_list(by)
+    levels = list(range(len(by)))
+    running = None
+
+    for chunk in read_gbd_chunks(path, by + [value], filters, chunksize):
+        partial = chunk.groupby(by, observed=True)[value] \
+                       .agg(['sum', 'count', 'min', 'max'])
+        partial = plain_index(partial)
+
+        if running is None:
+            running = partial
+        else:
+            running = pd.concat([running, partial]).groupby(level=levels) \
+                        .agg(AGGREGATES)
+
+    if running is None:
+        index = pd.MultiIndex.from_arrays([[]] * len(by), names=by)
+        running = pd.DataFrame(columns=list(AGGREGATES), index=index)
+
+    running = running.sort_index()
+    running['mean'] = running['sum'] / running['count']
+    return running
@@ -0,0 +1,163 @@
+'''
+This file implements the shared execution layer for the resampling tests
+(permutation tests and bootstraps) of the sub-questions.
+
+The work is split into fixed-size blocks. Every block gets its own random
+stream, spawned from np.random.SeedSequence(seed), so the results for a given
+seed are bit-identical no matter how many worker processes are used. Large
+input arrays are shared with the workers through shared memory instead of
+being pickled for every block.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_all_start_methods, get_context
+from multiprocessing import shared_memory
+import os
+
+import numpy as np
+
+from sequential import STEP, count_p_value
+
+MAX_ELEMENTS = 2 ** 22  # number of values in one block of resamples
+
+# Arrays attached by the worker processes (name -> array).
+worker_arrays = {}
+worker_memory = []
+
+
+def block_size_for(row_length, max_elements=MAX_ELEMENTS):
+    '''
+    Returns the number of resamples per block, only based on the size of the
+    data (so never on the number of workers).
+    '''
+    return max(1, max_elements // max(row_length, 1))
+
+
+def seed_sequence(seed):
+    ''' Returns a SeedSequence for an integer, None or SeedSequence. '''
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+class SharedArrays:
+    '''
+    Copies a dictionary of arrays into shared memory blocks.
+
+    Use as a context manager, the memory is released when leaving it:
+        with SharedArrays({'ranks': ranks}) as shared:
+            ... shared.specs can be passed to attach_arrays ...
+    '''
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.memory = []
+        self.specs = {}
+
+    def __enter__(self):
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=max(array.nbytes, 1))
+            self.memory.append(shm)
+
+            view = np.ndarray(array.shape, array.dtype, buffer=shm.buf)
+            view[...] = array
+            self.specs[name] = (shm.name, array.shape, array.dtype.str)
+        return self
+
+    def __exit__(self, *exc):
+        for shm in self.memory:
+            shm.close()
+            shm.unlink()
+        self.memory = []
+
+
+def attach_arrays(specs):
+    ''' Pool initializer: attaches the shared arrays inside a worker. '''
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        worker_memory.append(shm)
+        worker_arrays[name] = np.ndarray(shape, np.dtype(dtype),
+                                         buffer=shm.buf)
+
+
+def run_block(kernel, seed, size, params):
+    ''' Runs one block of resamples inside a worker. '''
+    rng = np.random.default_rng(seed)
+    return kernel(rng, size, worker_arrays, **params)
+
+
+def pool_context():
+    ''' Prefer fork, so scripts without a __main__ guard are not re-run. '''
+    if 'fork' in get_all_start_methods():
+        return get_context('fork')
+    return get_context()
+
+
+def run_blocks(kernel, total, arrays, seed=None, workers=1, block_size=None,
+               **params):
+    '''
+    Runs `total` resamples in blocks and yields the result of every block,
+    in order.
+
+    Args:
+    - kernel: module-level function kernel(rng, size, arrays, **params) that
+      returns the statistics of `size` resamples as an array.
+    - total: total number of resamples.
+    - arrays: dictionary with the (large) input arrays of the kernel.
+    - seed: integer or SeedSequence, each block gets a child of it.
+    - workers: number of processes (None uses all cores, 1 runs in this
+      process).
+    - block_size: resamples per block. The default only depends on the
+      length of the largest array.
+    - params: small extra arguments that are passed to the kernel.
+    '''
+    if block_size is None:
+        longest = max((len(a) for a in arrays.values()), default=1)
+        block_size = block_size_for(longest)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    sizes = [min(block_size, total - start)
+             for start in range(0, total, block_size)]
+    seeds = seed_sequence(seed).spawn(len(sizes))
+
+    if workers == 1 or len(sizes) <= 1:
+        for child, size in zip(seeds, sizes):
+            yield kernel(np.random.default_rng(child), size, arrays, **params)
+        return
+
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(min(workers, len(sizes)),
+                                 mp_context=pool_context(),
+                                 initializer=attach_arrays,
+                                 initargs=(shared.specs,)) as pool:
+            futures = list(map(pool.submit, repeat(run_block), repeat(kernel),
+                               seeds, sizes, repeat(params)))
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                # Stop the blocks that are not needed anymore.
+                for future in futures:
+                    future.cancel()
+
+
+def permutation_p_value(kernel, observed, total, arrays, seed=None,
+                        workers=1, block_size=None, sequential=False,
+                        alpha=0.05, **params):
+    '''
+    Returns the fraction of the `total` resampled statistics of the kernel
+    that are at least as large as the observed statistic.
+
+    With sequential=True the blocks are kept small and the test stops as
+    soon as the decision at alpha is settled (see sequential.py).
+    '''
+    if sequential and block_size is None:
+        longest = max((len(a) for a in arrays.values()), default=1)
+        block_size = min(block_size_for(longest), 10 * STEP)
+
+    blocks = run_blocks(kernel, total, arrays, seed, workers, block_size,
+                        **params)
+    return count_p_value(blocks, observed, total, sequential, alpha)
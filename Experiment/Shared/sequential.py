@@ -0,0 +1,177 @@
+'''
+This file implements the counting of permutation p-values, including an
+optional sequential Monte Carlo mode that stops early.
+
+In sequential mode the permutations are counted in small steps, and the
+test stops as soon as the decision at alpha (p-value <= alpha) is unlikely
+to differ from the decision after all permutations. After every step:
+ - a Clopper-Pearson interval is computed for the true p-value. The
+   intervals of all looks hold together with probability 1 - delta / 2
+   (a union bound over the maximum number of looks, with
+   delta = 1 - confidence);
+ - for every true p-value in that interval, the chance that the remaining
+   permutations still flip the current decision must be at most delta / 2.
+So the decision of a stopped test differs from the decision with all
+permutations with probability at most 1 - confidence, no matter how often
+the rule was checked. Run tests() to check this by simulation.
+'''
+
+from collections import namedtuple
+import math
+
+import numpy as np
+from scipy import special
+
+# Result of a sequential test:
+#  - p_value: the Monte Carlo p-value (exceedances / iterations).
+#  - iterations: the number of permutations that were used.
+#  - error: half-width of the (simultaneous) confidence interval of the
+#    p-value.
+SequentialResult = namedtuple('SequentialResult',
+                              ['p_value', 'iterations', 'error'])
+
+CONFIDENCE = 0.999      # chance that the decision equals the full test's
+MIN_PERMUTATIONS = 100  # never decide before this many permutations
+STEP = 100              # number of permutations between two checks
+
+
+def clopper_pearson(count, done, error_rate):
+    '''
+    Returns the exact (Clopper-Pearson) interval (lower, upper) of the
+    probability behind count successes in done draws, which misses it with
+    probability at most error_rate.
+    '''
+    lower = 0.0
+    if count > 0:
+        lower = special.betaincinv(count, done - count + 1, error_rate / 2)
+    upper = 1.0
+    if count < done:
+        upper = special.betaincinv(count + 1, done - count,
+                                   1 - error_rate / 2)
+    return lower, upper
+
+
+def flip_probability(count, done, total, alpha, lower, upper):
+    '''
+    Returns the largest chance, over the true p-values in [lower, upper],
+    that the decision after all total permutations differs from the
+    decision of the count exceedances in done permutations.
+    '''
+    remaining = total - done
+    # The full test is significant if it ends with at most this many.
+    most = math.floor(alpha * total + 1e-9)
+    margin = most - count
+
+    if count / done <= alpha:
+        # Flips if more than margin of the remaining ones exceed,
+        # most likely for the largest p-value.
+        if margin < 0:
+            return 1.0
+        if margin >= remaining:
+            return 0.0
+        return special.bdtrc(margin, remaining, upper)
+
+    # Flips if at most margin of the remaining ones exceed, most likely
+    # for the smallest p-value.
+    if margin < 0:
+        return 0.0
+    if margin >= remaining:
+        return 1.0
+    return special.bdtr(margin, remaining, lower)
+
+
+def count_p_value(batches, observed, total, sequential=False, alpha=0.05,
+                  confidence=CONFIDENCE, min_permutations=MIN_PERMUTATIONS):
+    '''
+    Counts how many permuted statistics are at least as large as the
+    observed statistic.
+
+    Args:
+    - batches: iterable with arrays of permuted statistics, in order.
+    - observed: the statistic of the actual data.
+    - total: the (maximum) number of permutations.
+    - sequential: stop as soon as the decision at alpha is settled.
+    - alpha: significance level of the decision.
+    - confidence: the chance that a stopped test makes the same decision
+      as the test with all permutations.
+    - min_permutations: never stop before this many permutations.
+
+    Returns:
+    The p-value, or a SequentialResult if sequential is True.
+    '''
+    count = 0
+    done = 0
+
+    # Every look gets an equal share of the error rate (union bound).
+    delta = 1 - confidence
+    looks = max(1, math.ceil(total / STEP))
+    look_error = delta / 2 / looks
+
+    for statistics in batches:
+        if not sequential:
+            count += np.count_nonzero(statistics >= observed)
+            done += len(statistics)
+            continue
+
+        # Check the stopping rule after every STEP permutations.
+        for start in range(0, len(statistics), STEP):
+            step = statistics[start:start + STEP]
+            count += np.count_nonzero(step >= observed)
+            done += len(step)
+
+            if done < min_permutations or done >= total:
+                continue
+
+            lower, upper = clopper_pearson(count, done, look_error)
+            if flip_probability(count, done, total, alpha, lower,
+                                upper) <= delta / 2:
+                # Stop the remaining batches (and worker processes).
+                if hasattr(batches, 'close'):
+                    batches.close()
+                return SequentialResult(float(count / done), done,
+                                        float(upper - lower) / 2)
+
+    if not sequential:
+        return count / total
+
+    lower, upper = clopper_pearson(count, done, look_error)
+    return SequentialResult(float(count / done), done,
+                            float(upper - lower) / 2)
+
+
+def tests(repeats=2000, total=2000, alpha=0.05, confidence=0.99, seed=0):
+    '''
+    Simulates permutation tests with known true p-values, and checks that
+    the stopped decisions agree with the decisions after all permutations
+    at least at the claimed rate. A lower confidence than the default is
+    used, so that disagreements would show up in a few thousand tests.
+    '''
+    rng = np.random.default_rng(seed)
+    # A disagreement rate above this is very unlikely (one-sided 99.9%)
+    # if the true rate is at most 1 - confidence.
+    limit = repeats * (1 - confidence)
+    limit += 3.1 * math.sqrt(limit * confidence) + 1
+
+    for p in [0.0, 0.01, 0.03, 0.045, 0.05, 0.055, 0.07, 0.2, 0.5]:
+        disagreements = 0
+        iterations = 0
+
+        for _ in range(repeats):
+            # 1 for a permuted statistic at least as large as the observed.
+            exceeds = (rng.random(total) < p).astype(np.int8)
+            full = count_p_value([exceeds], 1, total) <= alpha
+
+            result = count_p_value([exceeds], 1, total, True, alpha,
+                                   confidence)
+            disagreements += (result.p_value <= alpha) != full
+            iterations += result.iterations
+
+        print(f'p = {p:<6}: {disagreements} of {repeats} decisions differ, '
+              f'{iterations / repeats:.0f} of {total} permutations used')
+        assert disagreements <= limit, (p, disagreements)
+
+    print('All tests passed')
+
+
+if __name__ == "__main__":
+    tests()
@@ -1,26 +1,116 @@
+import numpy as np
 import pandas as pd
 
 # Make the code able run from any folder.
 from pathlib import Path
+import sys
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.append(str(BASE_DIR / 'Experiment/Shared'))
 
+from datasets import read_csv_cached  # noqa: E402
 
-def load_data():
+DATA_FILE = BASE_DIR / 'Data/age_socialmedia_mentalhealth.csv'
+
+# The daily social media usage answers, in order (SM_Time_val is 1 to 6).
+SM_TIMES = [
+    "Less than an Hour",
+    "Between 1 and 2 hours",
+    "Between 2 and 3 hours",
+    "Between 3 and 4 hours",
+    "Between 4 and 5 hours",
+    "More than 5 hours"
+]
+
+# The columns with the answers to the MH questions 9 to 19 (scores 1 to 5).
+MH_QUESTIONS = [f"MH_Q{i}" for i in range(9, 20)]
+
+
+def encode_platforms(platforms):
+    """
+        Encodes the platform lists ("Facebook, Twitter, ...") as bitmasks.
+
+        Only the distinct lists are split, so the cost does not depend on
+        the number of respondents.
+
+        Output:
+         - masks: The bitmask of every respondent (bit i is platform i), in
+           the smallest unsigned integer type that has a bit per platform.
+         - counts: The number of platforms in every list.
+         - platform_freq: The frequency of each platform, sorted.
+         - platforms: The platform names, in the order of the bits.
+    """
+
+    codes = platforms.cat.codes.to_numpy()
+    split = pd.Series(platforms.cat.categories).str.split(", ")
+
+    # Number the platforms in order of first appearance.
+    names = split.explode()
+    platform_codes, platform_names = pd.factorize(names)
+    rows = np.repeat(np.arange(len(split)), split.str.len())
+
+    if len(platform_names) > 64:
+        raise ValueError(f"Can not store {len(platform_names)} platforms "
+                         "in a bitmask of at most 64 bits")
+    dtype = np.min_scalar_type(2 ** max(len(platform_names), 1) - 1)
+
+    combination_masks = np.zeros(len(split), dtype=dtype)
+    np.bitwise_or.at(combination_masks, rows,
+                     np.left_shift(dtype.type(1),
+                                   platform_codes.astype(dtype)))
+
+    # Count every platform of every list once per respondent with that list.
+    respondents = np.bincount(codes[codes >= 0], minlength=len(split))
+    totals = np.bincount(platform_codes, weights=respondents[rows],
+                         minlength=len(platform_names)).astype(np.int64)
+    platform_freq = pd.Series(totals, index=platform_names, name="count")
+    platform_freq = platform_freq[platform_freq > 0] \
+        .sort_values(ascending=False, kind="stable")
+
+    masks = combination_masks[codes]
+    counts = split.str.len().to_numpy().astype(np.int8)[codes]
+    return masks, counts, platform_freq, list(platform_names)
+
+
+def platform_users(data, platform):
+    """ Returns a boolean mask of the respondents that use the platform. """
+
+    bit = data.attrs["platforms"].index(platform)
+    return (data["Platform_Mask"].to_numpy() >> bit) & 1 == 1
+
+
+def mh_answers(data):
+    """ Returns the MH question answers as an n x 11 int8 matrix. """
+
+    return data[MH_QUESTIONS].to_numpy(dtype=np.int8)
+
+
+def load_data(path=DATA_FILE):
     """
         Loads and cleans the data from dataset 2.
 
+        The text columns are categoricals and the scores small integers
+        (int8 answers, float32 MH_Score), so the data stays small for large
+        survey exports.
+
         Output:
          - data: The processed dataset with all the important features.
          - platform_freq: List of frequencies of each SM platform.
     """
 
-    # Extract the raw data from the csv file.
-    raw_data = pd.read_csv(BASE_DIR / 'Data/age_socialmedia_mentalhealth.csv')
+    # Extract the raw data from the csv file (through the columnar cache),
+    # with the text columns as categoricals.
+    raw_data = read_csv_cached(path, categorical=True)
 
     data = pd.DataFrame()
 
-    # Retrieve and process the necessary columns.
-    data['Date'] = pd.to_datetime(raw_data.iloc[:, 0]).dt.date  # Date
+    # Retrieve and process the necessary columns. The timestamps are
+    # parsed once per distinct value, and the dates are stored as midnight
+    # in seconds (pandas has no unit of days).
+    timestamps = raw_data.iloc[:, 0]
+    dates = pd.to_datetime(timestamps.cat.categories,
+                           format="%m/%d/%Y %H:%M:%S").normalize() \
+        .as_unit('s')
+    data['Date'] = dates.take(timestamps.cat.codes.to_numpy())  # Date
     data['Gender'] = raw_data.iloc[:, 2]                        # Gender
 
     # Retrieve the user ages and assign them an age group.
@@ -31,27 +121,26 @@ def load_data():
                                labels=age_labels, right=False)
 
     # Retrieve the daily social media usage along with a mapped version.
-    mapping = {
-        "Less than an Hour": 1,
-        "Between 1 and 2 hours": 2,
-        "Between 2 and 3 hours": 3,
-        "Between 3 and 4 hours": 4,
-        "Between 4 and 5 hours": 5,
-        "More than 5 hours": 6
-    }
-    data['SM_Time'] = raw_data.iloc[:, 8]
-    data["SM_Time_val"] = data["SM_Time"].map(mapping)
-
-    # Retrieve the platforms and calculate the amount and frequencies.
+    data['SM_Time'] = raw_data.iloc[:, 8].cat.set_categories(SM_TIMES,
+                                                             ordered=True)
+    sm_codes = data['SM_Time'].cat.codes
+    data["SM_Time_val"] = (sm_codes + 1).astype(np.int8).where(sm_codes >= 0)
+
+    # Retrieve the platforms and encode them as bitmasks, keeping the lists
+    # as a categorical.
     data['Platforms'] = raw_data.iloc[:, 7]
-    data["Platform_Count"] = data["Platforms"].str.split(", ").apply(len)
-    platform_freq = (data['Platforms'].str.
-                     split(', ', expand=True).stack().value_counts())
+    masks, counts, platform_freq, platforms = \
+        encode_platforms(data['Platforms'])
+    data["Platform_Mask"] = masks
+    data["Platform_Count"] = counts
+    data.attrs["platforms"] = platforms
 
     # Retrieves the MH questions scores and calculates a combined score.
-    data['MH_Questions'] = raw_data.iloc[:, 9:20].apply(lambda row: tuple(row),
-                                                        axis=1)
-    data['MH_Score'] = raw_data.iloc[:, 9:20].mean(axis=1)
+    answers = raw_data.iloc[:, 9:20].to_numpy(dtype=np.int8)
+    for i, column in enumerate(MH_QUESTIONS):
+        data[column] = answers[:, i]
+    data['MH_Score'] = (answers.sum(axis=1, dtype=np.int16) /
+                        np.float32(len(MH_QUESTIONS))).astype(np.float32)
 
     return data, platform_freq
 
@@ -1,6 +1,5 @@
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-import pandas as pd
 import seaborn as sns
 
 from collect_data import load_data
@@ -29,23 +28,8 @@ def plot_platform_freq(platform_freq):
 def plot_SM_use(data):
     """ Plots a barchart of the daily social media usage per age group. """
 
-    # Set the time order.
-    sm_time_order = [
-        "Less than an Hour",
-        "Between 1 and 2 hours",
-        "Between 2 and 3 hours",
-        "Between 3 and 4 hours",
-        "Between 4 and 5 hours",
-        "More than 5 hours"
-    ]
-
-    data["SM_Time"] = pd.Categorical(
-        data["SM_Time"],
-        categories=sm_time_order,
-        ordered=True
-    )
-
-    # Calculate the frequencies of each age group.
+    # Calculate the frequencies of each age group (SM_Time is ordered,
+    # see collect_data.SM_TIMES).
     freq_table = (
         data.groupby(["SM_Time", "Age_Group"], observed=True)
         .size()
@@ -115,7 +99,7 @@ def plot_MH_score(data):
 def plot_contingency_table(data, normalized):
     """Plot a heatmap of platform usage by age group."""
 
-    contingency_table = build_contingency_table(data)
+    contingency_table = build_contingency_table(data, cached=True)
 
     # Normalize by row (age group) if true.
     if normalized:
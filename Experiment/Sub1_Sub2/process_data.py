@@ -1,6 +1,49 @@
 from collect_data import load_data
+from collections import OrderedDict
+import hashlib
 import numpy as np
 import pandas as pd
+from scipy import sparse
+
+# Make the shared code importable from any folder.
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'Shared'))
+
+from parallel import block_size_for, permutation_p_value  # noqa: E402
+from sequential import count_p_value, STEP  # noqa: E402
+
+
+# -----------------------------------------------------------------------------
+# This section is shared by the permutation tests: ----------------------------
+# -----------------------------------------------------------------------------
+
+def permutation_batches(n, num_permutations, batch_size=None,
+                        sequential=False):
+    """ Yields chunks of random permutations of range(n).
+
+        The permutations are drawn with np.random.permutation, in the same
+        order as a loop over np.random.permutation(n) would draw them.
+    """
+
+    # Limit each chunk to roughly 2^22 values to keep the memory use low,
+    # and use small chunks if a sequential test might stop early.
+    if batch_size is None:
+        batch_size = max(1, 2**22 // max(n, 1))
+        if sequential:
+            batch_size = min(batch_size, STEP)
+
+    done = 0
+
+    while done < num_permutations:
+        size = min(batch_size, num_permutations - done)
+
+        perm = np.empty((size, n), dtype=np.intp)
+        for i in range(size):
+            perm[i] = np.random.permutation(n)
+
+        yield perm
+        done += size
 
 
 # -----------------------------------------------------------------------------
@@ -18,17 +61,14 @@ def rank_data(data):
     # Change duplicate values into averages.
     _, inverse, counts = np.unique(data, return_inverse=True,
                                    return_counts=True)
+    inverse = inverse.reshape(-1)
 
     # Calculate the average based on how many duplicates it has.
-    for i, count in enumerate(counts):
-        if count > 1:
-            tie_positions = np.where(inverse == i)[0]
-            avg_rank = np.mean(ranks[tie_positions])
-            ranks[tie_positions] = avg_rank
+    avg_ranks = np.bincount(inverse, weights=ranks) / counts
+    ranks = avg_ranks[inverse]
 
     # Add 1 so we have 1-based ranks.
-    for i in range(len(ranks)):
-        ranks[i] += 1
+    ranks += 1
 
     return ranks
 
@@ -52,8 +92,43 @@ def spearman_correlation(data_a, data_b):
     return rho
 
 
-def spearman_p_value(data_a, data_b, num_permutations=10000):
-    """ Calculate the p-value through a permutation test. """
+# A cell of a random table costs about as much as permuting this many values.
+TABLE_CELL_COST = 8
+
+
+def spearman_p_value(data_a, data_b, num_permutations=10000, batched=True,
+                     batch_size=None, workers=None, seed=None,
+                     sequential=False, alpha=0.05, replay=False):
+    """ Calculate the p-value through a permutation test.
+
+        With batched=True both datasets are ranked once, and the permutations
+        are drawn with their own random streams (see Shared/parallel.py):
+        tied data (like ages and scores) as random tables of how often each
+        rank meets each other rank, other data as permuted ranks.
+
+        With replay=True the precomputed ranks of data_b are permuted in
+        chunks of batch_size rows at a time with np.random.permutation.
+        This gives the same p-value as the loop for the same random seed,
+        but is much slower.
+
+        Giving workers and/or seed runs the permutations on a process pool.
+        The p-value then only depends on the seed, not on the number of
+        workers.
+
+        With sequential=True the test stops as soon as the decision at alpha
+        is settled, and returns (p_value, iterations, error) instead of only
+        the p-value (see Shared/sequential.py).
+    """
+
+    if workers is not None or seed is not None:
+        return spearman_p_value_parallel(data_a, data_b, num_permutations,
+                                         workers, seed, sequential, alpha)
+    if batched and not replay:
+        return spearman_p_value_parallel(data_a, data_b, num_permutations,
+                                         1, None, sequential, alpha)
+    if batched or sequential:
+        return spearman_p_value_batched(data_a, data_b, num_permutations,
+                                        batch_size, sequential, alpha)
 
     observed = spearman_correlation(data_a, data_b)
     count = 0
@@ -67,12 +142,178 @@ def spearman_p_value(data_a, data_b, num_permutations=10000):
     return count / num_permutations
 
 
+def spearman_p_value_batched(data_a, data_b, num_permutations=10000,
+                             batch_size=None, sequential=False, alpha=0.05):
+    """ Calculate the p-value through a vectorized permutation test. """
+
+    # Rank both datasets only once, a permutation doesn't change the ranks.
+    twice_a = twice_ranks(rank_data(np.asarray(data_a)))
+    twice_b = twice_ranks(rank_data(np.asarray(data_b)))
+    n = len(twice_a)
+
+    squares = np.sum(twice_a ** 2) + np.sum(twice_b ** 2)
+    observed = spearman_values(twice_a, twice_b, squares)
+
+    # Calculate the correlation of every permutation, chunk by chunk.
+    batches = (np.abs(spearman_values(twice_a, twice_b[perm], squares))
+               for perm in permutation_batches(n, num_permutations,
+                                               batch_size, sequential))
+
+    return count_p_value(batches, abs(observed), num_permutations,
+                         sequential, alpha)
+
+
+def twice_ranks(ranks):
+    """ Returns 2 * ranks as int64 integers.
+
+        Ranks are half-integers (ties get the average rank), so twice the
+        ranks are exact integers. The sums of their squares and products in
+        spearman_values stay below 2^63 up to about 1.5 million values,
+        while float64 sums of the ranks are only guaranteed to be exact up
+        to a few hundred thousand.
+    """
+
+    n = len(ranks)
+    # sum((2a)^2) + sum((2b)^2) <= 2 * sum((2k)^2) for k = 1..n
+    assert 8 * n * (n + 1) * (2 * n + 1) // 6 < 2**63, \
+        f"Too many values for exact Spearman sums: {n}"
+    return np.rint(2 * np.asarray(ranks)).astype(np.int64)
+
+
+def spearman_values(twice_a, perm_b, squares):
+    """ Calculates the Spearman correlation for every row of ranks.
+
+        The ranks are given doubled (see twice_ranks), with squares the
+        sum of the squares of both. The squared rank differences are then
+        sum((2a)^2) + sum((2b)^2) - 2 * sum(2a * 2b) = 4 * sum((a - b)^2),
+        computed exactly in int64.
+    """
+
+    return spearman_from_products(perm_b @ twice_a, squares, len(twice_a))
+
+
+def spearman_from_products(products, squares, n):
+    """ Calculates the Spearman correlation from the sums of the products
+        of the doubled ranks (see spearman_values).
+    """
+
+    d_squared = squares - 2 * products
+    return 1 - 6 * d_squared / (4 * n * (n**2 - 1))
+
+
+def spearman_kernel(rng, size, arrays):
+    """ Absolute Spearman correlation of size random permutations. """
+
+    twice_a = arrays['twice_a']
+    twice_b = arrays['twice_b']
+    squares = np.sum(twice_a ** 2) + np.sum(twice_b ** 2)
+
+    # Shuffling a copy in place draws the same permutations as shuffling
+    # a broadcast view, without a second copy.
+    perm_b = np.tile(twice_b, (size, 1))
+    rng.permuted(perm_b, axis=1, out=perm_b)
+    return np.abs(spearman_values(twice_a, perm_b, squares))
+
+
+def spearman_table_kernel(rng, size, arrays, squares, n):
+    """ Absolute Spearman correlation of size random permutations of tied
+        data.
+
+        A permutation only changes the correlation through the table of how
+        often each distinct rank of a meets each distinct rank of b. These
+        tables are drawn directly, cell by cell, with the hypergeometric
+        distribution, which is the distribution of the table under random
+        permutations.
+    """
+
+    values_a, counts_a = arrays['values_a'], arrays['counts_a']
+    values_b, counts_b = arrays['values_b'], arrays['counts_b']
+
+    # The values of b that are not drawn yet, a row per distinct rank.
+    remaining = np.repeat(counts_b[:, None], size, axis=1)
+    products = np.zeros(size, dtype=np.int64)
+
+    for value_a, count_a in zip(values_a.tolist(), counts_a.tolist()):
+        # Draw the ranks of b of the count_a values with rank value_a.
+        left = np.full(size, count_a)
+        rest = remaining.sum(axis=0)
+        for j, value_b in enumerate(values_b[:-1].tolist()):
+            if not left.any():
+                break
+            rest -= remaining[j]
+            drawn = rng.hypergeometric(remaining[j], rest, left)
+            products += (value_a * value_b) * drawn
+            remaining[j] -= drawn
+            left -= drawn
+
+        products += (value_a * values_b[-1]) * left
+        remaining[-1] -= left
+
+    return np.abs(spearman_from_products(products, squares, n))
+
+
+def spearman_p_value_parallel(data_a, data_b, num_permutations=10000,
+                              workers=None, seed=None, sequential=False,
+                              alpha=0.05):
+    """ Calculate the p-value through a permutation test on a process pool.
+
+        Tied data is permuted as tables of distinct ranks (see
+        spearman_table_kernel) when these tables are much smaller than the
+        data, other data as permuted ranks.
+    """
+
+    twice_a = twice_ranks(rank_data(np.asarray(data_a)))
+    twice_b = twice_ranks(rank_data(np.asarray(data_b)))
+    n = len(twice_a)
+
+    squares = np.sum(twice_a ** 2) + np.sum(twice_b ** 2)
+    observed = abs(spearman_values(twice_a, twice_b, squares))
+
+    values_a, counts_a = np.unique(twice_a, return_counts=True)
+    values_b, counts_b = np.unique(twice_b, return_counts=True)
+    cells = len(values_a) * len(values_b)
+
+    if cells * TABLE_CELL_COST > n:
+        arrays = {'twice_a': twice_a, 'twice_b': twice_b}
+        return permutation_p_value(spearman_kernel, observed,
+                                   num_permutations, arrays, seed, workers,
+                                   sequential=sequential, alpha=alpha)
+
+    block_size = block_size_for(cells)
+    if sequential:
+        block_size = min(block_size, 10 * STEP)
+
+    arrays = {'values_a': values_a, 'counts_a': counts_a,
+              'values_b': values_b, 'counts_b': counts_b}
+    return permutation_p_value(spearman_table_kernel, observed,
+                               num_permutations, arrays, seed, workers,
+                               block_size, sequential, alpha,
+                               squares=squares, n=n)
+
+
 # -----------------------------------------------------------------------------
 # This section is related to the Kruskal-Wallis calculations:  ----------------
 # -----------------------------------------------------------------------------
 
-def kruskal_wallis(groups):
-    """ Perform the Kruskal-Wallis test to obtain the H-statistic. """
+def tie_correction(ranks):
+    """ Calculates the tie correction factor for the H-statistic. """
+
+    # Count how often every (averaged) rank occurs.
+    _, counts = np.unique(ranks, return_counts=True)
+    N = len(ranks)
+
+    if N < 2:
+        return 1.0
+
+    return 1 - np.sum(counts ** 3 - counts) / (N ** 3 - N)
+
+
+def kruskal_wallis(groups, corrected=True):
+    """ Perform the Kruskal-Wallis test to obtain the H-statistic.
+
+        With corrected=True the statistic is divided by the tie correction
+        factor, which gives the same H as scipy.stats.kruskal.
+    """
 
     # Flatten the groups (but keep track of original groups).
     all_values = np.concatenate(groups)
@@ -92,11 +333,31 @@ def kruskal_wallis(groups):
 
     H = (12 / (N * (N + 1))) * H - 3 * (N + 1)
 
+    if corrected:
+        H /= tie_correction(ranks)
+
     return H
 
 
-def kruskal_p_value(groups, num_permutations=10000):
-    """ Calculate the p-value through a permutation test. """
+def kruskal_p_value(groups, num_permutations=10000, batched=True,
+                    batch_size=None, workers=None, seed=None,
+                    sequential=False, alpha=0.05):
+    """ Calculate the p-value through a permutation test.
+
+        With batched=True the pooled values are ranked once and only the
+        group assignment is permuted, in chunks of batch_size rows at a time.
+        This gives the same p-value as the loop for the same random seed.
+
+        Giving workers and/or seed runs the permutations on a process pool,
+        and sequential=True stops early, like spearman_p_value.
+    """
+
+    if workers is not None or seed is not None:
+        return kruskal_p_value_parallel(groups, num_permutations, workers,
+                                        seed, sequential, alpha)
+    if batched or sequential:
+        return kruskal_p_value_batched(groups, num_permutations, batch_size,
+                                       sequential, alpha)
 
     # Calculate the H-statistic for the actual data.
     observed_H = kruskal_wallis(groups)
@@ -122,27 +383,132 @@ def kruskal_p_value(groups, num_permutations=10000):
 
     return count / num_permutations
 
+
+def kruskal_h_values(ranks, lengths, rank_sums, correction):
+    """ Calculates the H-statistic for every row of group rank sums. """
+
+    N = len(ranks)
+    H = np.zeros(rank_sums.shape[0])
+
+    # Add the groups one by one, in the same order as kruskal_wallis.
+    for i, n_i in enumerate(lengths):
+        H += (rank_sums[:, i] ** 2) / n_i
+
+    H = (12 / (N * (N + 1))) * H - 3 * (N + 1)
+    return H / correction
+
+
+def kruskal_p_value_batched(groups, num_permutations=10000, batch_size=None,
+                            sequential=False, alpha=0.05):
+    """ Calculate the p-value through a vectorized permutation test. """
+
+    # Empty groups don't change the ranks, so they can be left out.
+    groups = [np.asarray(g) for g in groups if len(g) > 0]
+    lengths = np.array([len(g) for g in groups])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    # Rank the pooled values once, a permutation doesn't change the ranks.
+    ranks = rank_data(np.concatenate(groups))
+    correction = tie_correction(ranks)
+
+    observed_sums = np.add.reduceat(ranks, starts)[np.newaxis, :]
+    observed_H = kruskal_h_values(ranks, lengths, observed_sums,
+                                  correction)[0]
+
+    # Sum the ranks that end up in each group for a whole chunk at once.
+    batches = (kruskal_h_values(ranks, lengths,
+                                np.add.reduceat(ranks[perm], starts, axis=1),
+                                correction)
+               for perm in permutation_batches(len(ranks), num_permutations,
+                                               batch_size, sequential))
+
+    return count_p_value(batches, observed_H, num_permutations, sequential,
+                         alpha)
+
+
+def kruskal_kernel(rng, size, arrays, lengths, correction):
+    """ H-statistic of size random permutations of the pooled ranks. """
+
+    ranks = arrays['ranks']
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    perm = rng.permuted(np.broadcast_to(ranks, (size, len(ranks))), axis=1)
+    rank_sums = np.add.reduceat(perm, starts, axis=1)
+    return kruskal_h_values(ranks, lengths, rank_sums, correction)
+
+
+def kruskal_p_value_parallel(groups, num_permutations=10000, workers=None,
+                             seed=None, sequential=False, alpha=0.05):
+    """ Calculate the p-value through a permutation test on a process pool.
+    """
+
+    groups = [np.asarray(g) for g in groups if len(g) > 0]
+    lengths = np.array([len(g) for g in groups])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    ranks = rank_data(np.concatenate(groups))
+    correction = tie_correction(ranks)
+
+    observed_sums = np.add.reduceat(ranks, starts)[np.newaxis, :]
+    observed_H = kruskal_h_values(ranks, lengths, observed_sums,
+                                  correction)[0]
+
+    return permutation_p_value(kruskal_kernel, observed_H, num_permutations,
+                               {'ranks': ranks}, seed, workers,
+                               sequential=sequential, alpha=alpha,
+                               lengths=lengths, correction=correction)
+
 # -----------------------------------------------------------------------------
 # This section is related to the Chi-Square test: -----------------------------
 # -----------------------------------------------------------------------------
 
 
-def build_contingency_table(data):
-    """ Build a contingency table with the use of SM apps per age group. """
+def build_contingency_table(data, cached=False):
+    """ Build a contingency table with the use of SM apps per age group.
 
-    # Make empty table of the age groups compared to SM platforms.
-    platforms = data['Platforms'].str.split(', ').explode().unique()
-    age_groups = data['Age_Group'].cat.categories
-    contingency = pd.DataFrame(0, index=age_groups, columns=platforms)
+        With cached=True the table is stored per DataFrame contents, so the
+        plots and the Chi-Square test can share it without rebuilding it.
+    """
+
+    if cached:
+        key = contingency_key(data)
+        if key in contingency_cache:
+            contingency_cache.move_to_end(key)
+        else:
+            contingency_cache[key] = build_contingency_table(data)
+            if len(contingency_cache) > CONTINGENCY_CACHE_SIZE:
+                contingency_cache.popitem(last=False)
+        return contingency_cache[key].copy()
 
-    # Count the platform frequency per age group.
-    for _, row in data.iterrows():
-        for platform in row['Platforms'].split(', '):
-            contingency.loc[row['Age_Group'], platform] += 1
+    # Encode the age groups and platforms of all users at once.
+    age_codes, combination_codes, combination_matrix, age_groups, platforms = \
+        encode_respondents(data)
 
+    # Count the platform frequency per age group in one pass.
+    counts = contingency_tables(age_codes, combination_codes[np.newaxis, :],
+                                combination_matrix, len(age_groups))[0]
+
+    contingency = pd.DataFrame(counts.astype(np.int64), index=age_groups,
+                               columns=platforms)
     return contingency
 
 
+# The most recently used contingency tables built with cached=True, keyed
+# by contingency_key (the least recently used one is dropped first).
+CONTINGENCY_CACHE_SIZE = 8
+contingency_cache = OrderedDict()
+
+
+def contingency_key(data):
+    """ Returns a key that identifies the age groups and platforms. """
+
+    hashes = pd.util.hash_pandas_object(data[['Age_Group', 'Platforms']],
+                                        index=False)
+    digest = hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()
+
+    return digest, tuple(data['Age_Group'].cat.categories)
+
+
 def chi_square(contingency):
     """ Calculate the Chi-Square statistic from the contigency table. """
 
@@ -160,11 +526,29 @@ def chi_square(contingency):
     return chi2
 
 
-def chi_square_p_value(data, num_permutations=1000):
-    """ Calculate the p-value through a permutation test. """
+def chi_square_p_value(data, num_permutations=1000, batched=True,
+                       batch_size=None, workers=None, seed=None,
+                       sequential=False, alpha=0.05):
+    """ Calculate the p-value through a permutation test.
+
+        With batched=True the respondents are encoded once as a sparse
+        respondent x platform matrix, and the permuted tables of a whole
+        chunk are built with one bincount and one sparse matrix product.
+        This gives the same p-value as the loop for the same random seed.
+
+        Giving workers and/or seed runs the permutations on a process pool,
+        and sequential=True stops early, like spearman_p_value.
+    """
+
+    if workers is not None or seed is not None:
+        return chi_square_p_value_parallel(data, num_permutations, workers,
+                                           seed, sequential, alpha)
+    if batched or sequential:
+        return chi_square_p_value_batched(data, num_permutations, batch_size,
+                                          sequential, alpha)
 
     # Build the table and calculate chi score.
-    contingency_table = build_contingency_table(data)
+    contingency_table = build_contingency_table(data, cached=True)
     observed_chi2 = chi_square(contingency_table)
     count = 0
 
@@ -186,6 +570,147 @@ def chi_square_p_value(data, num_permutations=1000):
     return p_value
 
 
+def encode_respondents(data):
+    """ Encodes the respondents as integer codes and a sparse matrix.
+
+        The respondent x platform incidence matrix is stored factorized, as
+        combination_matrix[combination_codes], since most respondents share
+        the same few combinations of platforms.
+
+        Output:
+         - age_codes: The index of the age group of every respondent
+           (-1 if the respondent has no age group).
+         - combination_codes: The index of the platform combination of every
+           respondent.
+         - combination_matrix: Sparse combination x platform matrix with the
+           number of times each combination lists each platform.
+         - age_groups: The age group names, in the order of the codes.
+         - platforms: The platform names, in order of first appearance.
+    """
+
+    # Only the distinct combinations of platforms have to be split.
+    combination_codes, combinations = pd.factorize(data['Platforms'])
+    split = pd.Series(combinations).str.split(', ')
+
+    # Number the platforms in order of first appearance.
+    platform_codes, platforms = pd.factorize(split.explode())
+    rows = np.repeat(np.arange(len(split)), split.str.len())
+
+    # Duplicates are summed, so a platform listed twice counts twice.
+    combination_matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, platform_codes)),
+        shape=(len(combinations), len(platforms)))
+
+    age_codes = data['Age_Group'].cat.codes.to_numpy()
+    age_groups = data['Age_Group'].cat.categories
+
+    return (age_codes, combination_codes, combination_matrix, age_groups,
+            platforms)
+
+
+def chi_square_values(observed):
+    """ Calculate the Chi-Square statistic for a stack of tables. """
+
+    # Calculate the total uses of each row/column of every table.
+    row_totals = observed.sum(axis=2)[:, :, np.newaxis]
+    col_totals = observed.sum(axis=1)[:, np.newaxis, :]
+
+    # Calculate the total and compare to the expected amount.
+    grand_total = observed.sum(axis=(1, 2))[:, np.newaxis, np.newaxis]
+    expected = row_totals * col_totals / grand_total
+
+    # Calculate the statistic of every table.
+    terms = (observed - expected)**2 / expected
+    return terms.reshape(len(observed), -1).sum(axis=1)
+
+
+def contingency_tables(age_codes, perm_combinations, combination_matrix,
+                       num_groups):
+    """ Builds the contingency table for every row of permuted combinations.
+
+        Respondent j uses the platform combination perm_combinations[b, j].
+        The respondents of each chunk are counted per (age group,
+        combination) with a single bincount, and one sparse matrix product
+        turns these counts into the platform counts of every table.
+    """
+
+    size, n = perm_combinations.shape
+    num_combinations = combination_matrix.shape[0]
+
+    # Respondents without an age group are counted in an extra row.
+    codes = np.where(age_codes >= 0, age_codes, num_groups)
+    num_rows = num_groups + 1
+
+    rows = np.arange(size)[:, np.newaxis] * num_rows + codes
+    cells = rows * num_combinations + perm_combinations
+
+    counts = np.bincount(cells.ravel(),
+                         minlength=size * num_rows * num_combinations)
+    counts = counts.reshape(size * num_rows, num_combinations)
+
+    tables = np.asarray(counts @ combination_matrix)
+    tables = tables.reshape(size, num_rows, -1)
+
+    return tables[:, :num_groups, :]
+
+
+def chi_square_p_value_batched(data, num_permutations=1000,
+                               batch_size=None, sequential=False, alpha=0.05):
+    """ Calculate the p-value through a vectorized permutation test. """
+
+    age_codes, combination_codes, combination_matrix, age_groups, _ = \
+        encode_respondents(data)
+    k = len(age_groups)
+
+    # The observed table is shared with the plots through the cache.
+    observed = build_contingency_table(data, cached=True).values
+    observed_chi2 = chi_square_values(observed[np.newaxis])[0]
+
+    # Build the tables of a whole chunk of permutations at once.
+    batches = (chi_square_values(
+                   contingency_tables(age_codes, combination_codes[perm],
+                                      combination_matrix, k))
+               for perm in permutation_batches(len(age_codes),
+                                               num_permutations, batch_size,
+                                               sequential))
+
+    return count_p_value(batches, observed_chi2, num_permutations,
+                         sequential, alpha)
+
+
+def chi_square_kernel(rng, size, arrays, combination_matrix, num_groups):
+    """ Chi-Square statistic of size random permutations of the platforms.
+    """
+
+    codes = arrays['combination_codes']
+    perm_combinations = rng.permuted(np.broadcast_to(codes,
+                                                     (size, len(codes))),
+                                     axis=1)
+
+    tables = contingency_tables(arrays['age_codes'], perm_combinations,
+                                combination_matrix, num_groups)
+    return chi_square_values(tables)
+
+
+def chi_square_p_value_parallel(data, num_permutations=1000, workers=None,
+                                seed=None, sequential=False, alpha=0.05):
+    """ Calculate the p-value through a permutation test on a process pool.
+    """
+
+    age_codes, combination_codes, combination_matrix, age_groups, _ = \
+        encode_respondents(data)
+
+    observed = build_contingency_table(data, cached=True).values
+    observed_chi2 = chi_square_values(observed[np.newaxis])[0]
+
+    arrays = {'age_codes': age_codes, 'combination_codes': combination_codes}
+    return permutation_p_value(chi_square_kernel, observed_chi2,
+                               num_permutations, arrays, seed, workers,
+                               sequential=sequential, alpha=alpha,
+                               combination_matrix=combination_matrix,
+                               num_groups=len(age_groups))
+
+
 if __name__ == "__main__":
     data, platform_freq = load_data()
 
@@ -203,6 +728,6 @@ if __name__ == "__main__":
           f"p-value: {kruskal_p_value(groups)}")
 
     # Perform the Chi-Square statistic test:
-    contingency_table = build_contingency_table(data)
+    contingency_table = build_contingency_table(data, cached=True)
     print(f"chi: {chi_square(contingency_table)},"
           f"p-value: {chi_square_p_value(data)}")
@@ -16,7 +16,8 @@ from scipy.stats import spearmanr, chi2_contingency, kruskal
        - Scipy.spearmanr   : -0.2277815976450574, p_value = 4.437e-07
 
      - Kruskal-Wallis test between the age groups and mental health scores:
-       - Own implementation: 57.94384542777607, p_value < 1.0e-5
+       - Own implementation: 58.03068483012012, p_value < 1.0e-5
+         (57.94384542777607 without the tie correction)
        - Scipy.kruskal     : 58.03068483012012, p_value = 7.518e-12
 
      - Chi-Square statistic of the frequency of SM platform use per age group:
@@ -26,10 +27,10 @@ from scipy.stats import spearmanr, chi2_contingency, kruskal
     Conclusion:
       - The reported values come pretty close to the values obtained from
         Scipy.stats, and thus it can be assumed our implementations work
-        as intended. The Spearman and Kruskal tests do differ a bit
-        (although in both cases we still see the general same result),
-        which can be explained by scipy.stats using more advanced
-        algorithmes to solve ties.
+        as intended. The Spearman test does differ a bit (although we
+        still see the general same result), which can be explained by
+        scipy.stats using more advanced algorithmes to solve ties. The
+        Kruskal test uses the same tie correction as scipy.stats.
 
       - The p-values are all also very close to 0, showing that we can
         make the assumption that there is indeed a link between our data
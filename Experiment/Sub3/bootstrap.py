@@ -0,0 +1,173 @@
+'''
+This file implements a vectorized bootstrap for the confidence intervals of
+sub-question 3 (continent.py).
+'''
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Make the shared code importable from any folder.
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'Shared'))
+
+from parallel import run_blocks, seed_sequence  # noqa: E402
+
+MAX_BYTES = 2 ** 27  # memory ceiling for one chunk of resamples (128 MB)
+
+
+def chunk_rows(n, itemsize, max_bytes=MAX_BYTES):
+    '''
+    number of resamples of size n that fit within max_bytes, counting both
+    the resample indices and the resampled values
+    '''
+    per_row = max(n, 1) * (np.dtype(np.intp).itemsize + itemsize)
+    return max(1, max_bytes // per_row)
+
+
+def bootstrap_kernel(rng, size, arrays, statistic=np.mean):
+    '''
+    statistic of size resamples, drawn with a numpy Generator
+    '''
+    x = arrays['x']
+    indices = rng.integers(0, len(x), size=(size, len(x)))
+    return statistic(x[indices], axis=1)
+
+
+def bootstrap_replicates(x, N=10000, statistic=np.mean, max_bytes=MAX_BYTES,
+                         workers=None, seed=None):
+    '''
+    N bootstrap replicates of statistic(sample, axis=1), computed in chunks
+    of resamples. This gives the same replicates as calling
+    np.random.choice(x, size=len(x), replace=True) N times.
+
+    Giving workers and/or seed runs the chunks on a process pool with their
+    own random streams (see Shared/parallel.py), the replicates then only
+    depend on the seed and not on the number of workers.
+
+    An empty sample gives NaN replicates without drawing any random numbers,
+    like the loop over np.random.choice.
+    '''
+    x = np.asarray(x)
+    n = len(x)
+    if n == 0:
+        return np.full(N, np.nan)
+    rows = chunk_rows(n, x.itemsize, max_bytes)
+
+    if workers is not None or seed is not None:
+        blocks = run_blocks(bootstrap_kernel, N, {'x': x}, seed, workers,
+                            rows, statistic=statistic)
+        return np.concatenate(list(blocks))
+
+    replicates = np.empty(N)
+
+    for start in range(0, N, rows):
+        size = min(rows, N - start)
+        indices = np.random.randint(0, n, size=(size, n))
+        replicates[start:start + size] = statistic(x[indices], axis=1)
+
+    return replicates
+
+
+def jackknife_replicates(x, statistic=np.mean, max_bytes=MAX_BYTES):
+    '''
+    leave-one-out values of the statistic, computed in chunks
+    '''
+    x = np.asarray(x)
+    n = len(x)
+    rows = chunk_rows(n, x.itemsize, max_bytes)
+    replicates = np.empty(n)
+    keep = np.arange(n - 1)
+
+    for start in range(0, n, rows):
+        left_out = np.arange(start, min(start + rows, n))
+
+        # skip the left out index by shifting everything after it by one
+        indices = keep + (keep >= left_out[:, np.newaxis])
+        replicates[left_out] = statistic(x[indices], axis=1)
+
+    return replicates
+
+
+def bca_percentiles(x, replicates, level, statistic=np.mean,
+                    max_bytes=MAX_BYTES):
+    '''
+    bias-corrected and accelerated (BCa) percentiles of the interval
+    '''
+    normal = NormalDist()
+    theta = statistic(np.asarray(x)[np.newaxis, :], axis=1)[0]
+
+    # bias correction: how many replicates fall below the estimate
+    below = np.mean(replicates < theta)
+    below = min(max(below, 1 / len(replicates)), 1 - 1 / len(replicates))
+    z0 = normal.inv_cdf(below)
+
+    # acceleration from the skewness of the jackknife values
+    jack = jackknife_replicates(x, statistic, max_bytes)
+    diff = jack.mean() - jack
+    denominator = 6 * np.sum(diff ** 2) ** 1.5
+    a = np.sum(diff ** 3) / denominator if denominator > 0 else 0.0
+
+    percentiles = []
+    for alpha in [(1 - level) / 2, (1 + level) / 2]:
+        z = z0 + normal.inv_cdf(alpha)
+        percentiles.append(100 * normal.cdf(z0 + z / (1 - a * z)))
+
+    return percentiles
+
+
+def bootstrap_ci(groups, N=10000, level=0.95, method='percentile',
+                 statistic=np.mean, max_bytes=MAX_BYTES, workers=None,
+                 seed=None):
+    '''
+    bootstrap confidence intervals for every group in one call
+
+    Args:
+    - groups: dictionary with the group names as keys and arrays as values.
+      The groups are resampled in this order, so for a fixed seed the
+      results are the same as the loop over np.random.choice.
+    - N: number of bootstrap replicates per group.
+    - level: confidence level of the intervals.
+    - method: 'percentile' or 'bca'.
+    - statistic: function that reduces along an axis (like np.mean).
+    - max_bytes: memory ceiling for one chunk of resamples.
+    - workers, seed: run the resamples on a process pool, every group gets
+      its own child of the seed (see bootstrap_replicates).
+
+    Returns:
+    A DataFrame with the group names as index and the columns 'Mean' (the
+    mean of the replicates), 'CI_Lower' and 'CI_Upper'. They are NaN for
+    empty groups.
+    '''
+    results = {'Mean': [], 'CI_Lower': [], 'CI_Upper': []}
+
+    seeds = [None] * len(groups)
+    if workers is not None or seed is not None:
+        seeds = seed_sequence(seed).spawn(len(groups))
+
+    for x, group_seed in zip(groups.values(), seeds):
+        if len(x) == 0:
+            for column in results:
+                results[column].append(np.nan)
+            continue
+
+        replicates = bootstrap_replicates(x, N, statistic, max_bytes,
+                                          workers, group_seed)
+
+        if method == 'percentile':
+            # round to avoid floating point noise (2.5000000000000022)
+            percentiles = [round(100 * (1 - level) / 2, 10),
+                           round(100 * (1 + level) / 2, 10)]
+        elif method == 'bca':
+            percentiles = bca_percentiles(x, replicates, level, statistic,
+                                          max_bytes)
+        else:
+            raise ValueError(f"Unknown bootstrap method: {method}")
+
+        results['Mean'].append(np.mean(replicates))
+        results['CI_Lower'].append(np.percentile(replicates, percentiles[0]))
+        results['CI_Upper'].append(np.percentile(replicates, percentiles[1]))
+
+    return pd.DataFrame(results, index=list(groups.keys()))
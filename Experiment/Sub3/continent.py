@@ -1,114 +1,223 @@
+import math
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import pycountry_convert as pc
+
+from bootstrap import bootstrap_ci
 
 from pathlib import Path
+import sys
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.append(str(BASE_DIR / 'Experiment/Shared'))
+
+from parallel import permutation_p_value  # noqa: E402
+from sequential import STEP, count_p_value  # noqa: E402
+from datasets import read_csv_cached  # noqa: E402
+from gbd import load_gbd  # noqa: E402
+from countries import continents, UNKNOWN  # noqa: E402
+
+# Set a number of processes and/or a seed to run the bootstrap and the
+# permutation tests on a process pool (see Shared/parallel.py).
+WORKERS = None
+SEED = None
+
+# read in chunks with categorical columns, keeping only the columns and the
+# year that are used below (see Shared/gbd.py)
+data = load_gbd(BASE_DIR / "Data/IHME_original_file.csv",
+                usecols=['location', 'year', 'val'], filters={'year': 2021})
+data2 = read_csv_cached(BASE_DIR / "Data/percentages_population_users.csv")
+
+
+def ks_statistic(x, y):
+    '''
+    two-sample ks statistic D, using sorted arrays instead of a loop
+    '''
+    x = np.sort(np.asarray(x))
+    y = np.sort(np.asarray(y))
+    combined = np.concatenate([x, y])
+
+    # the percent of points that are smaller than each pooled value
+    cdf_x = np.searchsorted(x, combined, side='right') / len(x)
+    cdf_y = np.searchsorted(y, combined, side='right') / len(y)
+    return np.max(np.abs(cdf_x - cdf_y))
+
 
-data = pd.read_csv(BASE_DIR / "Data/IHME_original_file.csv")
-data2 = pd.read_csv(BASE_DIR / "Data/percentages_population_users.csv")
+def ks_permutation_statistics(sorted_labels, run_ends, n_x, n_y):
+    '''
+    ks statistic D for every row of labels (1 = x, 0 = y), where the labels
+    are given in the sorted order of the pooled values
+    '''
+    count_x = np.cumsum(sorted_labels, axis=1)
+    count_y = np.arange(1, sorted_labels.shape[1] + 1) - count_x
+
+    # only the last value of a group of ties gives the cdf of that value
+    cdf_x = count_x[:, run_ends] / n_x
+    cdf_y = count_y[:, run_ends] / n_y
+    return np.max(np.abs(cdf_x - cdf_y), axis=1)
 
 
-def country_to_continent(country_name):
+def kolmogorov_p_value(d, n_x, n_y):
     '''
-    convert country names to continent names
+    asymptotic p-value of the two-sample ks test (Kolmogorov distribution)
     '''
-    try:
-        country_alpha2 = pc.country_name_to_country_alpha2(country_name)
-        continent_code = pc.country_alpha2_to_continent_code(country_alpha2)
-        continent_name = pc.convert_continent_code_to_continent_name(continent_code)
-        return continent_name
-    except: # if it fails to get a continent name
-        return "Unknown"
+    en = np.sqrt(n_x * n_y / (n_x + n_y))
+    lam = (en + 0.12 + 0.11 / en) * d
+    if lam < 0.2:  # the series doesn't converge, but the p-value is ~1
+        return 1.0
 
+    k = np.arange(1, 101)
+    terms = 2 * (-1.0) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2)
+    return float(min(max(np.sum(terms), 0.0), 1.0))
 
-def ks_test(x, y):
+
+def ks_exact_p_value(d, n_x, n_y):
+    '''
+    exact p-value of the two-sample ks test, by counting the lattice paths
+    that stay within distance d (without ties)
+    '''
+    # work with integers: |i/n_x - j/n_y| < d  <=>  |i*n_y - j*n_x| < bound
+    bound = round(d * n_x * n_y)
+    j = np.arange(n_y + 1)
+    log_scale = 0.0
+
+    paths = np.where(np.abs(j * n_x) < bound, 1.0, 0.0)
+    paths = np.cumprod(paths)  # the first row stops at the first gap
+
+    for i in range(1, n_x + 1):
+        inside = np.abs(i * n_y - j * n_x) < bound
+        paths = np.where(inside, paths, 0.0)
+
+        # the band is an interval, so a path can only come from the left
+        paths = np.where(inside, np.cumsum(paths), 0.0)
+
+        # rescale to avoid overflow of the path counts
+        largest = paths.max()
+        if largest == 0:
+            return 1.0
+        paths /= largest
+        log_scale += np.log(largest)
+
+    # divide by the total number of paths (n_x + n_y choose n_x)
+    log_total = (math.lgamma(n_x + n_y + 1) - math.lgamma(n_x + 1)
+                 - math.lgamma(n_y + 1))
+    inside_prob = paths[-1] * np.exp(log_scale - log_total)
+    return float(min(max(1 - inside_prob, 0.0), 1.0))
+
+
+def ks_kernel(rng, size, arrays, n_x, n_y):
+    '''
+    ks statistic D of size random permutations of the labels
+    '''
+    labels = arrays['labels']
+    perm = rng.permuted(np.broadcast_to(labels, (size, len(labels))), axis=1)
+    return ks_permutation_statistics(perm, arrays['run_ends'], n_x, n_y)
+
+
+def ks_test(x, y, N=1000, method='permutation', batch_size=None,
+            workers=None, seed=None, sequential=False, alpha=0.05):
     '''
     ks test
 
+    method:
+     - 'permutation': p-value from N random permutations (gives the same
+       p-value as the loop version for the same np.random seed, or runs on
+       a process pool when workers and/or seed are given)
+     - 'exact': exact p-value from the lattice path count
+     - 'asymptotic': p-value from the Kolmogorov distribution
+     - 'auto': 'exact' for small samples, otherwise 'asymptotic'
+
+    sequential=True stops the permutations as soon as the decision at alpha
+    is settled, and returns (p_value, iterations, error)
     '''
     x = np.array(x)
     y = np.array(y)
-    combined = np.concatenate([x, y])
-    combined = np.sort(combined)
-    max_d = 0
-
-    for i in combined:
-        cdf_x = np.sum(x <= i) / len(x)  # the percent of points that are smaller than the current value
-        cdf_y = np.sum(y <= i) / len(y)
-        diff = abs(cdf_x - cdf_y)
-        if diff > max_d:
-            max_d = diff
-    count = 0  # the number of times that the distance is higher than real distance
+    max_d = ks_statistic(x, y)
+
+    if method == 'auto':
+        method = 'exact' if len(x) * len(y) <= 10 ** 6 else 'asymptotic'
+    if method == 'exact':
+        return ks_exact_p_value(max_d, len(x), len(y))
+    if method == 'asymptotic':
+        return kolmogorov_p_value(max_d, len(x), len(y))
+
     combined2 = np.concatenate([x, y])
-    N = 1000
+    total = len(combined2)
+
+    # sort the pooled values once, and find the end of every group of ties
+    sort_order = np.argsort(combined2, kind='stable')
+    sorted_values = combined2[sort_order]
+    run_ends = np.flatnonzero(np.append(np.diff(sorted_values) != 0, True))
 
-    for i in range(N):
-        np.random.shuffle(combined2)
-        x_2 = combined2[:len(x)]
-        y_2 = combined2[len(x):]
-        p_max_d = 0
-        for c in combined:
-            cx_2 = np.sum(x_2 <= c) / len(x_2)
-            cy_2 = np.sum(y_2 <= c) / len(y_2)
-            perm_d = abs(cx_2 - cy_2)
-            if perm_d > p_max_d:
-                p_max_d = perm_d
+    if workers is not None or seed is not None:
+        labels = (sort_order < len(x)).astype(np.int64)
+        arrays = {'labels': labels, 'run_ends': run_ends}
+        return permutation_p_value(ks_kernel, max_d, N, arrays, seed,
+                                   workers, sequential=sequential,
+                                   alpha=alpha, n_x=len(x), n_y=len(y))
 
-        if p_max_d >= max_d:
-            count += 1
+    if batch_size is None:
+        batch_size = max(1, 2 ** 22 // max(total, 1))
+        if sequential:
+            batch_size = min(batch_size, STEP)
 
-    pvalue = count / N
-    return pvalue
+    def batches():
+        order = np.arange(total)
+        done = 0
 
+        while done < N:
+            size = min(batch_size, N - done)
 
-# create new columns for Continents
-data2['Continent'] = data2['Country'].apply(country_to_continent)
-data['Continent'] = data['location'].apply(country_to_continent)
+            # shuffle in the same way as np.random.shuffle(combined2) would
+            labels = np.zeros((size, total), dtype=np.int64)
+            for i in range(size):
+                np.random.shuffle(order)
+                labels[i, order[:len(x)]] = 1
+
+            yield ks_permutation_statistics(labels[:, sort_order], run_ends,
+                                            len(x), len(y))
+            done += size
+
+    return count_p_value(batches(), max_d, N, sequential, alpha)
+
+
+# create new columns for Continents, every country name is resolved once
+# (see Shared/countries.py)
+data2['Continent'] = continents(data2['Country'])
+data['Continent'] = continents(data['location'])
 
 # filter out unknown Continents
-data = data[data['Continent'] != "Unknown"]
-data2 = data2[data2['Continent'] != "Unknown"]
+data = data[data['Continent'] != UNKNOWN]
+data2 = data2[data2['Continent'] != UNKNOWN]
 
 data.to_csv("continent_mental_health.csv", index=False)
 data2.to_csv("continent_media_use.csv", index=False)
 
 # bootstrap
 N = 10000
-continents = data['Continent'].unique()
-continents2 = data2['Continent'].unique()
-
-plot_data = {
-    'Continent': [],
-    'Mean': [],
-    'CI_Lower': [],
-    'CI_Upper': []
-}
-
-plot_data2 = {
-    'Continent': [],
-    'Mean': [],
-    'CI_Lower': [],
-    'CI_Upper': []
-}
-
-for continent in continents:
-    x = data[(data['Continent'] == continent) & (data['year'] == 2021)]['val'].values
-    x = x[~np.isnan(x)]  # filter out NaN values
-    boot_means = []
-    for i in range(N):
-        sample = np.random.choice(x, size=len(x), replace=True)
-        boot_means.append(np.mean(sample))
+continent_names = data['Continent'].unique()
+continent_names2 = data2['Continent'].unique()
 
-    ci_l = np.percentile(boot_means, 2.5)
-    ci_u = np.percentile(boot_means, 97.5)
-    mean = np.mean(boot_means)
 
-    plot_data['Continent'].append(continent)
-    plot_data['Mean'].append(mean)
-    plot_data['CI_Lower'].append(ci_l)
-    plot_data['CI_Upper'].append(ci_u)
+def continent_ci(groups):
+    '''
+    bootstrap means and 95% CIs of every continent, in the plot_data format
+    '''
+    ci = bootstrap_ci(groups, N, workers=WORKERS, seed=SEED)
+    return {
+        'Continent': list(ci.index),
+        'Mean': list(ci['Mean']),
+        'CI_Lower': list(ci['CI_Lower']),
+        'CI_Upper': list(ci['CI_Upper'])
+    }
+
+
+groups = {}
+for continent in continent_names:
+    x = data[data['Continent'] == continent]['val'].values
+    x = x[~np.isnan(x)]  # filter out NaN values
+    groups[continent] = x
+
+plot_data = continent_ci(groups)
 
 
 plt.figure(figsize=(10, 6))
@@ -132,22 +241,13 @@ plt.legend()
 # plt.savefig("continent_comparison_mental.png", dpi=300)
 plt.show()
 
-for continent in continents2:
+groups2 = {}
+for continent in continent_names2:
     x = data2[data2['Continent'] == continent]['Social Media Users (%)'].values
     x = x[~np.isnan(x)]  # filter out NaN values
-    boot_means = []
-    for i in range(N):
-        sample = np.random.choice(x, size=len(x), replace=True)
-        boot_means.append(np.mean(sample))
-
-    ci_l = np.percentile(boot_means, 2.5)
-    ci_u = np.percentile(boot_means, 97.5)
-    mean = np.mean(boot_means)
+    groups2[continent] = x
 
-    plot_data2['Continent'].append(continent)
-    plot_data2['Mean'].append(mean)
-    plot_data2['CI_Lower'].append(ci_l)
-    plot_data2['CI_Upper'].append(ci_u)
+plot_data2 = continent_ci(groups2)
 
 
 plt.figure(figsize=(10, 6))
@@ -196,13 +296,13 @@ for i in range(len(continent_list)):
         if overlap <= 0:
             continue  # if there is no overlap
 
-        x1 = data[(data['Continent'] == c1) & (data['year'] == 2021)]['val'].values
-        x2 = data[(data['Continent'] == c2) & (data['year'] == 2021)]['val'].values
+        x1 = data[data['Continent'] == c1]['val'].values
+        x2 = data[data['Continent'] == c2]['val'].values
 
         x1 = x1[~np.isnan(x1)]  # filter out NaN values
         x2 = x2[~np.isnan(x2)]
 
-        pvalue = ks_test(x1, x2)
+        pvalue = ks_test(x1, x2, workers=WORKERS, seed=SEED)
 
         p_map.loc[c1, c2] = pvalue
         p_map.loc[c2, c1] = pvalue
@@ -267,7 +367,7 @@ for i in range(len(continent_list2)):
         x1 = x1[~np.isnan(x1)]
         x2 = x2[~np.isnan(x2)]
 
-        pvalue = ks_test(x1, x2)
+        pvalue = ks_test(x1, x2, workers=WORKERS, seed=SEED)
 
         p_map2.loc[c1, c2] = pvalue
         p_map2.loc[c2, c1] = pvalue
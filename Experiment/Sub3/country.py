@@ -1,23 +1,24 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
 from pathlib import Path
+import sys
 BASE_DIR = Path(__file__).resolve().parents[2]
-
-df_mh = pd.read_csv(BASE_DIR / "Data/merged_final.csv")
-df_users = pd.read_csv(BASE_DIR / "Data/social_media_users_2021.csv")
-df_pop = pd.read_csv(BASE_DIR / "Data/IHME-GBD_2023_DATA-aeeaa03f-1.csv")
-
-df_pop_clean = df_pop[(df_pop["measure_name"] == "Population") &
-                      (df_pop["metric_name"] == "Number") &
-                      (df_pop["year"] == 2021)]
-
-df_pop_clean = df_pop_clean[["location_name", "val"]]
-df_pop_clean.columns = ["Country", "Population"]
-
-df = df_mh.merge(df_users, on="Country", how="inner")
-df = df.merge(df_pop_clean, on="Country", how="inner")
+sys.path.append(str(BASE_DIR / 'Experiment/Shared'))
+
+from countries import UNKNOWN  # noqa: E402
+from country_panel import load_panel  # noqa: E402
+
+# The 2021 values of the countries that have all three, joined on their ISO
+# code (see Shared/country_panel.py).
+df = load_panel(["mental_health_percent", "social_media_users",
+                 "population"], year=2021)
+df = df.dropna(subset=["mental_health_percent", "social_media_users",
+                       "population"])
+df = df.rename(columns={"country": "Country", "continent": "Continent",
+                        "mental_health_percent": "MentalHealthPercent",
+                        "social_media_users": "Social Media Users (N)",
+                        "population": "Population"})
 
 df["SocialMediaShare"] = (df["Social Media Users (N)"] /
                           df["Population"]) * 100
@@ -107,197 +108,10 @@ plt.legend()
 plt.tight_layout()
 plt.show()
 
-# Asked chatgpt for continent grouping.
-continent_map = {
-    'Philippines': 'Asia',
-    'Thailand': 'Asia',
-    'Sri Lanka': 'Asia',
-    'Myanmar': 'Asia',
-    'Malaysia': 'Asia',
-    'China': 'Asia',
-    'Indonesia': 'Asia',
-    'Cambodia': 'Asia',
-    'Kazakhstan': 'Asia',
-    'Armenia': 'Asia',
-    'Turkmenistan': 'Asia',
-    'Tonga': 'Oceania',
-    'Tajikistan': 'Asia',
-    'Mongolia': 'Asia',
-    'Kiribati': 'Oceania',
-    'Samoa': 'Oceania',
-    'Papua New Guinea': 'Oceania',
-    'Georgia': 'Asia',
-    'Japan': 'Asia',
-    'Singapore': 'Asia',
-    'Uzbekistan': 'Asia',
-    'Palestine': 'Asia',
-    'Nepal': 'Asia',
-    'Bangladesh': 'Asia',
-    'Pakistan': 'Asia',
-    'India': 'Asia',
-    'Yemen': 'Asia',
-    'Bhutan': 'Asia',
-    'Maldives': 'Asia',
-    'Saudi Arabia': 'Asia',
-    'Bahrain': 'Asia',
-    'Iraq': 'Asia',
-    'Jordan': 'Asia',
-    'Turkey': 'Asia',
-    'Israel': 'Asia',
-    'Afghanistan': 'Asia',
-
-    # Oceania
-    'Fiji': 'Oceania',
-    'Solomon Islands': 'Oceania',
-    'Vanuatu': 'Oceania',
-    'New Zealand': 'Oceania',
-    'American Samoa': 'Oceania',
-    'Cook Islands': 'Oceania',
-    'Tuvalu': 'Oceania',
-    'Palau': 'Oceania',
-    'Nauru': 'Oceania',
-    'Australia': 'Oceania',
-    'Samoa': 'Oceania',
-
-    # Europe
-    'Russian Federation': 'Europe',
-    'Andorra': 'Europe',
-    'Lithuania': 'Europe',
-    'Romania': 'Europe',
-    'Czechia': 'Europe',
-    'Serbia': 'Europe',
-    'Ukraine': 'Europe',
-    'Croatia': 'Europe',
-    'Estonia': 'Europe',
-    'Belgium': 'Europe',
-    'Bulgaria': 'Europe',
-    'Hungary': 'Europe',
-    'Slovakia': 'Europe',
-    'North Macedonia': 'Europe',
-    'Slovenia': 'Europe',
-    'Montenegro': 'Europe',
-    'Latvia': 'Europe',
-    'Poland': 'Europe',
-    'Albania': 'Europe',
-    'Denmark': 'Europe',
-    'Finland': 'Europe',
-    'France': 'Europe',
-    'Greece': 'Europe',
-    'Germany': 'Europe',
-    'Ireland': 'Europe',
-    'Spain': 'Europe',
-    'Sweden': 'Europe',
-    'Norway': 'Europe',
-    'Iceland': 'Europe',
-    'Italy': 'Europe',
-    'Portugal': 'Europe',
-    'Luxembourg': 'Europe',
-    'Malta': 'Europe',
-    'Netherlands': 'Europe',
-    'United Kingdom': 'Europe',
-    'San Marino': 'Europe',
-    'Monaco': 'Europe',
-    'Switzerland': 'Europe',
-
-    # Africa
-    'Egypt': 'Africa',
-    'Algeria': 'Africa',
-    'Morocco': 'Africa',
-    'Tunisia': 'Africa',
-    'Libya': 'Africa',
-    'Djibouti': 'Africa',
-    'Mozambique': 'Africa',
-    'Gabon': 'Africa',
-    'Kenya': 'Africa',
-    'Ethiopia': 'Africa',
-    'Malawi': 'Africa',
-    'Somalia': 'Africa',
-    'Eritrea': 'Africa',
-    'Madagascar': 'Africa',
-    'Comoros': 'Africa',
-    'Mauritius': 'Africa',
-    'Angola': 'Africa',
-    'Burundi': 'Africa',
-    'Uganda': 'Africa',
-    'Zambia': 'Africa',
-    'Zimbabwe': 'Africa',
-    'South Africa': 'Africa',
-    'Botswana': 'Africa',
-    'Lesotho': 'Africa',
-    'Ghana': 'Africa',
-    'Cabo Verde': 'Africa',
-    'Burkina Faso': 'Africa',
-    'Eswatini': 'Africa',
-    'Cameroon': 'Africa',
-    'Benin': 'Africa',
-    'Liberia': 'Africa',
-    'Chad': 'Africa',
-    'Gambia': 'Africa',
-    'Mali': 'Africa',
-    'Namibia': 'Africa',
-    'Niger': 'Africa',
-    'Nigeria': 'Africa',
-    'Mauritania': 'Africa',
-    'Seychelles': 'Africa',
-    'Senegal': 'Africa',
-    'South Sudan': 'Africa',
-    'Sierra Leone': 'Africa',
-    'Togo': 'Africa',
-    'Sudan': 'Africa',
-    'Rwanda': 'Africa',
-    'Guinea': 'Africa',
-    'Equatorial Guinea': 'Africa',
-
-    # North America
-    'United States': 'North America',
-    'Canada': 'North America',
-    'Bahamas': 'North America',
-    'Grenada': 'North America',
-    'Cuba': 'North America',
-    'Haiti': 'North America',
-    'Jamaica': 'North America',
-    'Barbados': 'North America',
-    'Belize': 'North America',
-    'Guyana': 'South America',
-    'Panama': 'North America',
-    'Honduras': 'North America',
-    'El Salvador': 'North America',
-    'Costa Rica': 'North America',
-    'Guatemala': 'North America',
-    'Mexico': 'North America',
-    'Bermuda': 'North America',
-    'Dominica': 'North America',
-    'Saint Lucia': 'North America',
-    'Nicaragua': 'North America',
-
-    # South America
-    'Argentina': 'South America',
-    'Brazil': 'South America',
-    'Chile': 'South America',
-    'Peru': 'South America',
-    'Ecuador': 'South America',
-    'Colombia': 'South America',
-    'Paraguay': 'South America',
-    'Uruguay': 'South America',
-    'Suriname': 'South America',
-    'Bolivia': 'South America',
-    'Venezuela': 'South America',
-    'Guyana': 'South America',
-
-    # Middle East (treated under Asia or Africa depending on country)
-    'Kuwait': 'Asia',
-    'Oman': 'Asia',
-    'Qatar': 'Asia',
-    'United Arab Emirates': 'Asia',
-}
-# checked for missing countries already
-
-df_cont = pd.DataFrame(list(continent_map.items()),
-                       columns=['Country', 'Continent'])
-df = df.merge(df_cont, on="Country", how="left")
 print(df.columns)
-print("Missing continents:", df["Continent"].isna().sum())
-continent_sm = df.groupby("Continent")["SocialMediaShare"].mean()
+print("Missing continents:", (df["Continent"] == UNKNOWN).sum())
+continent_sm = df[df["Continent"] != UNKNOWN] \
+    .groupby("Continent", observed=True)["SocialMediaShare"].mean()
 continent_sm_df = continent_sm.reset_index()
 continent_sm_df.columns = ["Continent", "AverageSocialMediaShare"]
 
@@ -1,11 +1,12 @@
 ''' This file collects the data for the 4th sub-question for this research: '''
 
-import pandas as pd
-
-
 # Make the code able run from any folder.
 from pathlib import Path
+import sys
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.append(str(BASE_DIR / 'Experiment/Shared'))
+
+from datasets import read_csv_cached  # noqa: E402
 
 mental_health_file = BASE_DIR / 'Data/mental_health_change_rate.csv'
 ratios_social_media_file = BASE_DIR / 'Data/ratios_countries_social_media.csv'
@@ -17,62 +18,63 @@ class CollectData4:
         self.file_social_media_ratios = ratios_social_media_file
         self.p_value = 0.05
 
+        # Each file is read once, the frames are cached here.
+        self.users_data = None
+        self.mental_health_data = None
+        self.joined_data = None
+
     def CollectRatioUsers(self):
-        df = pd.read_csv(self.file_social_media_ratios,
-                         usecols=['Country', 'Social Media Users Growth (%)'])
-        return df
+        if self.users_data is None:
+            self.users_data = read_csv_cached(
+                self.file_social_media_ratios,
+                usecols=['Country', 'Social Media Users Growth (%)'])
+        return self.users_data
 
     def CollectRatioMentalHealth(self):
-        df = pd.read_csv(self.file_mental_health,
-                         usecols=['location', 'change_rate'])
-        return df
+        if self.mental_health_data is None:
+            self.mental_health_data = read_csv_cached(
+                self.file_mental_health, usecols=['location', 'change_rate'])
+        return self.mental_health_data
+
+    def JoinData(self):
+        ''' Joins both files on the country, keeping the first row of every
+            country (in the order of the social media file).
+        '''
+        if self.joined_data is None:
+            df1 = self.CollectRatioUsers().drop_duplicates('Country')
+            df2 = (self.CollectRatioMentalHealth()
+                   .drop_duplicates('location')
+                   .rename(columns={'location': 'Country'}))
+            self.joined_data = df1.merge(df2, on='Country', how='inner')
+        return self.joined_data
 
     def FindIntersection(self):
         ''' Returns the countries that are in both CSV files.'''
-        # Social media Growth
-        df1 = pd.read_csv(self.file_social_media_ratios,
-                          usecols=['Country', 'Social Media Users Growth (%)'])
-
-        # Mental health
-        df2 = pd.read_csv(self.file_mental_health,
-                          usecols=['location', 'change_rate'])
-
-        countries_intersection = (set(df1['Country'].values).
-                                  intersection(df2['location'].values))
-        return countries_intersection
+        return set(self.JoinData()['Country'].values)
 
     def FindDifference(self):
         ''' Returns the countries that are not in both CSV files.'''
-
-        df1 = pd.read_csv(self.file_social_media_ratios,
-                          usecols=['Country', 'Social Media Users Growth (%)'])
-
-        # Mental health
-        df2 = pd.read_csv(self.file_mental_health,
-                          usecols=['location', 'change_rate'])
-
-        countries_diff = (set(df1['Country'].values).
-                          difference(df2['location'].values))
-
+        countries_diff = (set(self.CollectRatioUsers()['Country'].values).
+                          difference(self.FindIntersection()))
         return countries_diff
 
-    def GetResults(self):
+    def GetResults(self, as_arrays=False):
         ''' Returns the results as a list of 3-tuples:
             (country, ratio_social_media_users, ratio_mental_health)
+
+            With as_arrays=True the results are returned as three NumPy
+            arrays (countries, ratios_social_media_users,
+            ratios_mental_health) instead.
         '''
-        countries_intersection = self.FindIntersection()
-        df1 = self.CollectRatioUsers()
-        df2 = self.CollectRatioMentalHealth()
-
-        results = []
-
-        for country in countries_intersection:
-            ratio_users = df1.loc[df1['Country'] == country,
-                                  'Social Media Users Growth (%)'].values[0]
-            ratio_mental_health = df2.loc[df2['location'] == country,
-                                          'change_rate'].values[0]
-            results.append((country, ratio_users, ratio_mental_health))
-        return results
+        joined = self.JoinData()
+        countries = joined['Country'].to_numpy()
+        ratios_users = joined['Social Media Users Growth (%)'].to_numpy()
+        ratios_mental_health = joined['change_rate'].to_numpy()
+
+        if as_arrays:
+            return countries, ratios_users, ratios_mental_health
+
+        return list(zip(countries, ratios_users, ratios_mental_health))
 
 
 if __name__ == "__main__":
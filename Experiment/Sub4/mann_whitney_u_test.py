@@ -2,90 +2,143 @@
 This file implements the Mann-Whitney U test for sub-question 4.
 '''
 
+from functools import lru_cache
+from math import comb, erfc
+
+import numpy as np
 from numpy import sqrt
 
+# Largest n1 * n2 for which the 'auto' p-value uses the exact distribution.
+EXACT_MAX_SIZE = 200 * 200
+
+
+@lru_cache(maxsize=None)
+def exact_u_cdf(n1, n2):
+    '''
+    Returns the exact cumulative distribution P(U <= u), u = 0, ..., n1 * n2,
+    of the U-statistic without ties, memoized by (n1, n2).
+
+    The number of rankings with U = u is the coefficient of q^u in the
+    generating function prod_{i=1}^{n1} (1 - q^(n2 + i)) / (1 - q^i). The
+    coefficients are computed with exact integers, so also the far tails are
+    exact.
+    '''
+    if n1 > n2:
+        return exact_u_cdf(n2, n1)
+
+    counts = np.zeros(n1 * n2 + 1, dtype=object)
+    counts[0] = 1
+
+    for i in range(1, n1 + 1):
+        # Multiply by (1 - q^(n2 + i)).
+        m = n2 + i
+        counts[m:] = counts[m:] - counts[:-m]
+
+        # Divide by (1 - q^i): a running sum over every i-th coefficient.
+        for r in range(i):
+            counts[r::i] = np.cumsum(counts[r::i])
+
+    cdf = np.array([c / comb(n1 + n2, n1) for c in np.cumsum(counts)])
+    cdf.setflags(write=False)
+    return cdf
+
 
 class MannWhitney:
     def __init__(self, batch_fast, batch_slow):
         '''
         Initialization of Mann-Whitney U test.
 
+        The ranks, rank sums and U-statistics are computed once here, the
+        methods below return the cached values.
+
         Args:
         - self: The current instance of the class.
-        - batch_fast: The list with fast uptake countries, consists of 3-tuples
-            like:
+        - batch_fast: The fast uptake countries, either as an array with the
+            mental health changes or as a list of 3-tuples like:
             ('fast uptake', social_media_users_change, mental_health_change)
-        - batch_slow: The list with slow uptake countries, consists of 3-tuples
-            like:
+        - batch_slow: The slow uptake countries, either as an array with the
+            mental health changes or as a list of 3-tuples like:
             ('slow uptake', social_media_users_change, mental_health_change)
         '''
         self.fast_batch = batch_fast
         self.slow_batch = batch_slow
 
+        self.fast_values = self.GetScores(batch_fast)
+        self.slow_values = self.GetScores(batch_slow)
+        self.n1 = len(self.fast_values)
+        self.n2 = len(self.slow_values)
+
+        self.ranks, self.tie_sizes = self.CalculateRanks()
+        self.R1 = float(self.ranks[:self.n1].sum())
+        self.R2 = float(self.ranks[self.n1:].sum())
+
+        n1, n2 = self.n1, self.n2
+        self.U1 = (n1 * n2) + ((n1 * (n1 + 1)) / 2) - self.R1
+        self.U2 = (n1 * n2) + ((n2 * (n2 + 1)) / 2) - self.R2
+
+    @staticmethod
+    def GetScores(batch):
+        ''' Returns the mental health changes of a batch as a float array. '''
+        if isinstance(batch, np.ndarray):
+            return batch.astype(float).ravel()
+
+        return np.array([x[2] if isinstance(x, tuple) else x for x in batch],
+                        dtype=float)
+
     def SortMentalHealthScores(self):
-        batches_combined = self.fast_batch + self.slow_batch
+        ''' Returns the order that sorts the combined mental health scores. '''
+        combined = np.concatenate([self.fast_values, self.slow_values])
 
-        # sorts by mental health score
-        batches_combined.sort(key=lambda x: x[2])
-        return batches_combined
+        # A stable sort keeps the fast uptake countries first within ties.
+        return combined, np.argsort(combined, kind='mergesort')
 
     def CalculateRanks(self):
-        batches = self.SortMentalHealthScores()
-        ranked = []
-
-        for i in range(len(batches)):
-            score = batches[i][2]
+        '''
+        Calculates the ranks of the combined batches (fast uptake countries
+        first), giving tied entries the average of their ranks.
 
-            j = i
+        Returns the ranks and the sizes of the groups of ties.
+        '''
+        combined, order = self.SortMentalHealthScores()
+        sorted_scores = combined[order]
+        n = len(sorted_scores)
 
-            while j < len(batches) and batches[j][2] == score:
-                j += 1
-            avg_rank = (i + 1 + j) / 2
+        # Find the first and last (exclusive) position of every tie group.
+        new_group = np.ones(n, dtype=bool)
+        new_group[1:] = sorted_scores[1:] != sorted_scores[:-1]
+        starts = np.flatnonzero(new_group)
+        ends = np.append(starts[1:], n)
 
-            # Assigning the same rank to all the tied entries
-            for k in range(i, j):
-                country_data = batches[k]
-                tuple_data = (country_data[0], country_data[1],
-                              country_data[2], avg_rank)
-            ranked.append((tuple_data))
+        # Assigning the same rank to all the tied entries
+        avg_ranks = (starts + 1 + ends) / 2
+        ranks = np.empty(n)
+        ranks[order] = np.repeat(avg_ranks, ends - starts)
 
-        return ranked
+        return ranks, ends - starts
 
     def SplitCombinedBatches(self):
-        ''' Splits the combined batches again after calculating the ranks. '''
-        ranked = self.CalculateRanks()
-        batch_fast = [x for x in ranked if x[0] == 'fast uptake']
-        batch_slow = [x for x in ranked if x[0] == 'slow uptake']
-        return batch_fast, batch_slow
+        ''' Splits the combined ranks again into the two batches. '''
+        return self.ranks[:self.n1], self.ranks[self.n1:]
 
     def GetSumRanks(self):
         '''
-        Calculates the sum of the ranks for both the fast uptake (R1) and slow
+        Returns the sum of the ranks for both the fast uptake (R1) and slow
         uptake countries (R2).
         '''
-        batch_fast, batch_slow = self.SplitCombinedBatches()
-        R1 = sum(x[-1] for x in batch_fast)
-        R2 = sum(x[-1] for x in batch_slow)
-
-        return R1, R2
+        return self.R1, self.R2
 
     def GetLengths(self):
-        n1 = len(self.fast_batch)
-        n2 = len(self.slow_batch)
-        return n1, n2
+        return self.n1, self.n2
 
     def CalculateU(self):
-        ''' Calculates the U-statistics U1 and U2.'''
-        n1, n2 = self.GetLengths()
-
-        R1, R2 = self.GetSumRanks()
-        U1 = (n1 * n2) + ((n1 * (n1 + 1)) / 2) - R1
-        U2 = (n1 * n2) + ((n2 * (n2 + 1)) / 2) - R2
+        ''' Returns the U-statistics U1 and U2.'''
+        return self.U1, self.U2
 
-        return U1, U2
-
-    def CalculateZScore(self, U1, U2):
+    def CalculateZScore(self, U1=None, U2=None):
         ''' Calculates the Z-score  '''
+        if U1 is None or U2 is None:
+            U1, U2 = self.CalculateU()
+
         min_U = min(U1, U2)
         mean = self.CalculateMean()
         std = self.CalculateSTD()
@@ -96,7 +149,55 @@ class MannWhitney:
         n1, n2 = self.GetLengths()
         return (n1 * n2) / 2
 
-    def CalculateSTD(self):
+    def CalculateVariance(self, tie_correction=True):
+        '''
+        Calculates the variance of U under the null hypothesis. Ties lower
+        the variance, the tie correction takes this into account.
+        '''
+        n1, n2 = self.GetLengths()
+        n = n1 + n2
+        variance = (n1 * n2 * (n + 1)) / 12
+
+        if tie_correction and n > 1:
+            t = self.tie_sizes.astype(float)
+            variance -= (n1 * n2 * np.sum(t ** 3 - t)) / (12 * n * (n - 1))
+
+        return variance
+
+    def CalculateSTD(self, tie_correction=True):
+        return sqrt(self.CalculateVariance(tie_correction))
+
+    def CalculatePValue(self, method='auto', use_continuity=True):
+        '''
+        Calculates the two-sided p-value of the test.
+
+        Args:
+        - self: The current instance of the class.
+        - method: 'exact' uses the exact distribution of U, 'normal' the
+            normal approximation of the z-score. 'auto' uses the exact
+            distribution when there are no ties and n1 * n2 is at most
+            EXACT_MAX_SIZE, and the normal approximation otherwise.
+        - use_continuity: moves U half a step towards the mean in the
+            normal approximation, because U is discrete. Like scipy's
+            mannwhitneyu(..., method='asymptotic', use_continuity=True).
+        '''
         n1, n2 = self.GetLengths()
-        std = sqrt((n1 * n2 * (n1 + n2 + 1)) / 12)
-        return std
+        has_ties = np.any(self.tie_sizes > 1)
+
+        if method == 'auto':
+            small = n1 * n2 <= EXACT_MAX_SIZE
+            method = 'exact' if small and not has_ties else 'normal'
+
+        if method == 'exact':
+            if has_ties:
+                raise ValueError("The exact p-value assumes no ties.")
+            min_U = int(min(self.CalculateU()))
+            return min(1.0, 2 * exact_u_cdf(n1, n2)[min_U])
+        if method == 'normal':
+            distance = self.CalculateMean() - min(self.CalculateU())
+            if use_continuity:
+                distance -= 0.5
+            # A U within half a step of the mean gives a p-value of 1.
+            return min(1.0, erfc(distance / self.CalculateSTD() / sqrt(2)))
+
+        raise ValueError(f"Unknown p-value method: {method}")
@@ -24,8 +24,7 @@ BASE_DIR = Path(__file__).resolve().parents[2]
 mental_health_file = BASE_DIR / 'Data/mental_health_change_rate.csv'
 ratios_social_media_file = BASE_DIR / 'Data/ratios_countries_social_media.csv'
 
-# Source: https://en.wikipedia.org/wiki/97.5th_percentile_point
-ACCEPTANCE_VALUE = 1.96  # Z score for alpha = 0.05
+ALPHA = 0.05  # significance level of the test
 
 
 # Functions #
@@ -46,71 +45,73 @@ def get_median(values: list):
 
 
 # Collecting Data #
-def get_batches(mental_health_file, ratios_social_media_file, testing=False):
-
+def get_batches(mental_health_file, ratios_social_media_file, testing=False,
+                as_arrays=False):
+    '''
+    Splits the countries at the median growth in social media users.
+
+    With testing or as_arrays set, the batches are NumPy arrays with only the
+    mental health changes. Otherwise they are lists of 3-tuples like
+    ('fast uptake', users_change, mental_health_change).
+    '''
     collect_data = CollectData4(mental_health_file, ratios_social_media_file)
-    data = collect_data.GetResults()
+    _, users_values, mental_health_values = \
+        collect_data.GetResults(as_arrays=True)
 
-    users_values, mental_health_values = [], []
-    fast_uptakes = []
-    slow_uptakes = []
+    users_values = users_values / 100  # The user values are in percentages
 
-    for country, users_change, mental_health_change in data:
-        users_change /= 100  # The user values are in percentages
+    users_median = get_median(users_values)
+    fast = users_values > users_median
 
-        # Can be uncommented for testing.
-        # print(f'Country: {country}, Users: {users_change}, '
-        #       f'mental health: {mental_health_change}')
-        # if users_change > 1.00 or users_change < -0.50:
-        #     print(f'Country: {country}, Users: {users_change}, '
-        #           f'mental health: {mental_health_change}')
+    if testing or as_arrays:
+        return mental_health_values[fast], mental_health_values[~fast]
 
-        users_values.append(users_change)
-        mental_health_values.append(mental_health_change)
-
-    users_median = get_median(users_values)
-    # mental_health_median = get_median(mental_health_values)
-
-    for i, users_val in enumerate(users_values):
-        if users_val > users_median:
-            if testing:
-                fast_uptakes.append(mental_health_values[i])
-            else:
-                fast_uptakes.append(('fast uptake', users_val,
-                                     mental_health_values[i]))
-        else:
-            if testing:
-                slow_uptakes.append(mental_health_values[i])
-            else:
-                slow_uptakes.append(('slow uptake', users_val,
-                                     mental_health_values[i]))
+    fast_uptakes = [('fast uptake', users_val, mental_health_val)
+                    for users_val, mental_health_val
+                    in zip(users_values[fast], mental_health_values[fast])]
+    slow_uptakes = [('slow uptake', users_val, mental_health_val)
+                    for users_val, mental_health_val
+                    in zip(users_values[~fast], mental_health_values[~fast])]
 
     return fast_uptakes, slow_uptakes
 
 
 # Function for linear regression #
-def get_U1_U2_Z_score(mental_health_file, ratios_social_media_file):
+def get_mann_whitney(mental_health_file, ratios_social_media_file):
     batch_fast, batch_slow = get_batches(mental_health_file,
-                                         ratios_social_media_file)
+                                         ratios_social_media_file,
+                                         as_arrays=True)
+    return MannWhitney(batch_fast, batch_slow)
+
 
-    mann_whitney = MannWhitney(batch_fast, batch_slow)
+def get_U1_U2_Z_score(mental_health_file, ratios_social_media_file):
+    mann_whitney = get_mann_whitney(mental_health_file,
+                                    ratios_social_media_file)
     U1, U2 = mann_whitney.CalculateU()
     z_score = mann_whitney.CalculateZScore(U1, U2)
     return U1, U2, z_score
 
 
-def run_statistical_test(mental_health_file, ratios_social_media_file):
-    ''' Executes the Mann-Whitney U test in order to check the distribution '''
-    U1, U2, z_score = get_U1_U2_Z_score(mental_health_file,
-                                        ratios_social_media_file)
+def run_statistical_test(mental_health_file, ratios_social_media_file,
+                         method='auto'):
+    '''
+    Executes the Mann-Whitney U test in order to check the distribution.
+    The p-value is exact for small batches without ties, and uses the
+    normal approximation otherwise (see MannWhitney.CalculatePValue).
+    '''
+    mann_whitney = get_mann_whitney(mental_health_file,
+                                    ratios_social_media_file)
+    U1, U2 = mann_whitney.CalculateU()
+    z_score = mann_whitney.CalculateZScore(U1, U2)
+    p_value = mann_whitney.CalculatePValue(method)
 
     print('\nMann-Whitney U test: Our implementation')
     print(f'U1 = {U1:.2f}, U2 = {U2:.2f}')
 
-    print(f'Absolute z-score: {abs(z_score):.2f}')
+    print(f'Absolute z-score: {abs(z_score):.2f}, p: {p_value:.2f}')
 
     print('\nConclusion: Hypothesis')
-    if abs(z_score) <= ACCEPTANCE_VALUE:
+    if p_value > ALPHA:
         # Inside of acceptance interval
         message = '''FAILED TO REJECT NULL HYPOTHESIS:
         No difference in mental health scores between countries
@@ -139,7 +140,7 @@ def test(mental_health_file, ratios_social_media_file):
     print('\nMann-Whitney U Test: Scipy.stats')
     print(f'Statistics: {stat:.2f}, p: {p_value:.2f}')
 
-    if p_value > 0.05:
+    if p_value > ALPHA:
         message = '''FAILED TO REJECT NULL HYPOTHESIS:
         No difference in mental health scores between countries
         that have either fast or slow uptakes in number of social